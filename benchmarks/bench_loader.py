@@ -0,0 +1,37 @@
+"""
+Parity check and benchmark of the transcript parsers.
+
+Checks that process_transcript_fast returns the same sections as process_transcript for
+every transcript in data/transcripts_*, then times both parsers.
+
+Usage (from the repository root):
+    python benchmarks/bench_loader.py
+"""
+import glob
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transcript_loader import process_transcript, process_transcript_fast
+
+
+def main(number=5):
+    file_paths = sorted(glob.glob("data/transcripts_*/*.docx"))
+
+    for file_path in file_paths:
+        expected, actual = process_transcript(file_path), process_transcript_fast(file_path)
+        assert actual == expected, f"Fast parser differs on {file_path}"
+    print(f"parity:      {len(file_paths)} transcripts identical")
+
+    before = timeit.timeit(lambda: [process_transcript(path) for path in file_paths], number=number) / number
+    after = timeit.timeit(lambda: [process_transcript_fast(path) for path in file_paths], number=number) / number
+
+    print(f"python-docx: {before * 1e3:8.1f} ms for {len(file_paths)} transcripts")
+    print(f"fast parser: {after * 1e3:8.1f} ms for {len(file_paths)} transcripts")
+    print(f"speedup:     {before / after:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
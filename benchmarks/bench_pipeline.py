@@ -0,0 +1,188 @@
+"""
+Offline benchmark of the whole tagging pipeline.
+
+Runs TranscriptTagger on synthetic transcripts (sampled from data/transcripts_*) with the
+deterministic fake chat model and embeddings of fake_models.py, so no network access is
+needed, and measures throughput, p50/p99 section latency, peak Python memory and prompt bytes.
+Results are saved as JSON with the git commit, to compare runs across commits.
+
+Usage (from the repository root):
+    python benchmarks/bench_pipeline.py --sections 10 100 1000 --output bench_results.json
+    python benchmarks/bench_pipeline.py --sections 10 100 1000 --concurrency 16 --compare bench_results.json
+
+    # Endpoint throttling above 20 req/s, AdaptiveRateLimiter at 90% of it (--quota-fraction 0 runs without limiter)
+    python benchmarks/bench_pipeline.py --sections 200 --concurrency 16 --llm-latency 0.2 --rate-limit 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+from langchain_community.vectorstores import FAISS
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakes import FakeChatModel, FakeEmbeddings, synthetic_transcripts
+from rate_limiter import AdaptiveRateLimiter
+from tag_definitions import tags
+from transcript_tagger import TranscriptTagger
+
+
+HIGHLIGHTS_PATH = "data/Raw Condens Data - highlights_export.csv"
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_tagger(args, quote_tag_map, embeddings):
+    quote_vector_store = FAISS.from_texts(list(quote_tag_map.keys()), embeddings, normalize_L2=True)
+    tag_vector_store = FAISS.from_texts(sorted(set(tag.lower() for tag in quote_tag_map.values())), embeddings, normalize_L2=True)
+    llm = FakeChatModel(sorted(set(tag.lower() for tag in quote_tag_map.values())),
+                        latency=args.llm_latency, latency_per_1k_tokens=args.llm_latency_per_1k_tokens,
+                        max_requests_per_second=args.rate_limit)
+    rate_limiter = None
+    if args.rate_limit and args.quota_fraction > 0:
+        rate_limiter = AdaptiveRateLimiter(requests_per_minute=args.rate_limit * 60 * args.quota_fraction,
+                                           max_concurrency=args.concurrency, base_delay=0.2, max_delay=5.0, burst_seconds=0.1)
+    tagger = TranscriptTagger(tags, llm, quote_tag_map, quote_vector_store, tag_vector_store,
+                              max_concurrency=args.concurrency, batch_token_budget=args.batch_token_budget,
+                              rate_limiter=rate_limiter)
+    return tagger, llm
+
+
+def timed(function, latencies, per_item):
+    # Wraps a tagging function to record the latency of every section it tags
+    def wrapper(*args):
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            latencies.extend([time.perf_counter() - start] * per_item(*args))
+    return wrapper
+
+
+def timed_async(coroutine_function, latencies, per_item):
+    async def wrapper(*args):
+        start = time.perf_counter()
+        try:
+            return await coroutine_function(*args)
+        finally:
+            latencies.extend([time.perf_counter() - start] * per_item(*args))
+    return wrapper
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else None
+
+
+def run_scenario(args, n_sections, quote_tag_map):
+    embeddings = FakeEmbeddings(latency=args.embed_latency, latency_per_text=args.embed_latency_per_text)
+    tagger, llm = build_tagger(args, quote_tag_map, embeddings)
+    transcripts = synthetic_transcripts(n_sections, seed=args.seed)
+
+    latencies = []
+    tagger._tag_section = timed(tagger._tag_section, latencies, lambda section, examples=None: 1)
+    tagger._tag_batch = timed(tagger._tag_batch, latencies, lambda batch, batch_examples=None: len(batch))
+    tagger._atag_section = timed_async(tagger._atag_section, latencies, lambda section, examples=None: 1)
+    tagger._atag_batch = timed_async(tagger._atag_batch, latencies, lambda batch, batch_examples=None: len(batch))
+    embeddings.calls = 0
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    if args.use_async:
+        df = asyncio.run(tagger.atag_transcripts(transcripts))
+    else:
+        df = tagger.tag_transcripts(transcripts)
+    elapsed = time.perf_counter() - start
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'sections': n_sections,
+        'seconds': elapsed,
+        'sections_per_second': n_sections / elapsed,
+        'p50_section_latency': percentile(latencies, 0.50),
+        'p99_section_latency': percentile(latencies, 0.99),
+        'peak_memory_bytes': peak_memory,
+        'llm_calls': llm.calls,
+        'llm_requests_per_second': llm.calls / elapsed,
+        'throttles': llm.throttles,
+        'prompt_bytes': llm.prompt_bytes,
+        'embedding_calls': embeddings.calls,
+        'rows': len(df),
+        'failed_sections': len(tagger.failed_sections),
+    }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {scenario['sections']: scenario for scenario in json.load(f)['scenarios']}
+    print(f"\nCompared to {baseline_path}:")
+    for scenario in results['scenarios']:
+        before = baseline.get(scenario['sections'])
+        if before is None:
+            continue
+        print(f"{scenario['sections']:>7} sections: "
+              f"throughput x{scenario['sections_per_second'] / before['sections_per_second']:.2f}, "
+              f"prompt bytes x{scenario['prompt_bytes'] / max(1, before['prompt_bytes']):.2f}, "
+              f"peak memory x{scenario['peak_memory_bytes'] / max(1, before['peak_memory_bytes']):.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sections', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--use-async', action='store_true')
+    parser.add_argument('--batch-token-budget', type=int, default=None)
+    parser.add_argument('--llm-latency', type=float, default=0.01)
+    parser.add_argument('--llm-latency-per-1k-tokens', type=float, default=0.0)
+    parser.add_argument('--embed-latency', type=float, default=0.0)
+    parser.add_argument('--embed-latency-per-text', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=float, default=None, help="Requests per second above which the fake LLM throttles")
+    parser.add_argument('--quota-fraction', type=float, default=0.9,
+                        help="Share of --rate-limit given to the AdaptiveRateLimiter, 0 runs without rate limiter")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help="JSON file the results are written to")
+    parser.add_argument('--compare', default=None, help="JSON results of a previous run to compare with")
+    args = parser.parse_args()
+
+    quote_tag_map = pd.read_csv(HIGHLIGHTS_PATH).set_index('Quote')['Tag'].to_dict()
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'scenarios': [],
+    }
+    print(f"{'sections':>9}{'sec/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'peak MB':>10}{'calls':>8}{'prompt MB':>11}"
+          f"{'req/s':>8}{'throttles':>11}{'failed':>8}")
+    for n_sections in args.sections:
+        scenario = run_scenario(args, n_sections, quote_tag_map)
+        results['scenarios'].append(scenario)
+        print(f"{n_sections:>9}{scenario['sections_per_second']:>10.1f}{scenario['p50_section_latency'] * 1e3:>10.1f}"
+              f"{scenario['p99_section_latency'] * 1e3:>10.1f}{scenario['peak_memory_bytes'] / 2**20:>10.1f}"
+              f"{scenario['llm_calls']:>8}{scenario['prompt_bytes'] / 2**20:>11.2f}"
+              f"{scenario['llm_requests_per_second']:>8.1f}{scenario['throttles']:>11}{scenario['failed_sections']:>8}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
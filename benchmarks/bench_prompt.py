@@ -0,0 +1,52 @@
+"""
+Micro-benchmark of prompt construction.
+
+Compares rebuilding the whole prompt for every section (tag instructions, eligible tags and
+str.format over the full template) with the pre-rendered prefix used by TranscriptTagger.
+
+Usage (from the repository root):
+    python benchmarks/bench_prompt.py
+"""
+import os
+import sys
+import timeit
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tag_definitions import tags
+from transcript_tagger import TranscriptTagger, QuoteTagExample, QUOTE_TAGGING_PROMPT
+
+
+HIGHLIGHTS_PATH = "data/Raw Condens Data - highlights_export.csv"
+
+
+def rebuild_prompt(tagger, quote, examples):
+    # What construct_prompt did for every section before the prefix was pre-rendered
+    few_shot_examples = "[" + ", ".join([tagger.format_example(example) for example in examples]) + "]"
+    return QUOTE_TAGGING_PROMPT.format(quote_text=quote,
+                                       eligible_tags="<tag_separator>".join(list(tagger.tag_quote_map.keys())),
+                                       tag_instructions=tagger.tag_instructions(),
+                                       few_shot_examples=few_shot_examples)
+
+
+def main(number=2000):
+    df = pd.read_csv(HIGHLIGHTS_PATH)
+    quote_tag_map = df.set_index('Quote')['Tag'].to_dict()
+    tagger = TranscriptTagger(tags, None, quote_tag_map, None, None)
+
+    quote = "He's about 5. So either like daycare at sometimes and then also like just taking care of him from home."
+    examples = [QuoteTagExample(quote=q, tag=t) for q, t in list(quote_tag_map.items())[:10]]
+
+    before = timeit.timeit(lambda: rebuild_prompt(tagger, quote, examples), number=number) / number
+    after = timeit.timeit(lambda: tagger.construct_prompt(quote, examples), number=number) / number
+
+    print(f"prompt rebuilt per section: {before * 1e6:8.1f} us/prompt")
+    print(f"pre-rendered prefix:        {after * 1e6:8.1f} us/prompt")
+    print(f"speedup:                    {before / after:8.1f}x")
+    print(f"static prefix size:         {len(tagger.prompt_prefix):8d} chars")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""
+Synthetic transcripts used by the benchmarks. The fake chat model and embeddings live in
+fake_models.py at the repository root and are re-exported here.
+"""
+import glob
+import random
+from typing import Dict, List
+
+from fake_models import FakeChatModel, FakeEmbeddings, FakeMessage, ThrottlingException
+from transcript_loader import TranscriptSection, process_transcript_fast
+
+
+def synthetic_transcripts(n_sections: int, sections_per_transcript: int = 25, seed: int = 0,
+                          pattern: str = "data/transcripts_*/*.docx") -> Dict[str, List[TranscriptSection]]:
+    """
+    Transcripts of n_sections sections in total, sampled from the real sections of the data folder
+    so answer lengths follow the shape of the interviews.
+    """
+    pool = [section for file_path in sorted(glob.glob(pattern)) for section in process_transcript_fast(file_path)]
+    rng = random.Random(seed)
+
+    transcripts = {}
+    for start in range(0, n_sections, sections_per_transcript):
+        participant = f"P{len(transcripts) + 1} Synthetic"
+        transcripts[participant] = [rng.choice(pool) for _ in range(min(sections_per_transcript, n_sections - start))]
+    return transcripts
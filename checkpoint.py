@@ -0,0 +1,60 @@
+import json
+import os
+import threading
+from typing import Optional
+
+
+class TaggingCheckpoint:
+    def __init__(self, path: str):
+        """
+        Append-only manifest of the (participant, section index) pairs already tagged.
+
+        Every completed section is one JSON line, so a job killed at any point can be
+        restarted and skips the sections recorded here. A line can also record the size of the
+        output file once the rows of the section were written, see output_size.
+
+        Parameters:
+        - path (str): Path of the manifest file (JSON lines), created on first write.
+        """
+        self.path = path
+        self.completed = set()
+        # Size of the output file at the last recorded line, None if never recorded
+        self.output_size = None
+        self._lock = threading.Lock()
+
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Partial last line of an interrupted write
+                        continue
+                    if 'participant' in record:
+                        self.completed.add((record['participant'], record['section']))
+                    if 'output_size' in record:
+                        self.output_size = record['output_size']
+
+    def is_done(self, participant: str, section_index: int) -> bool:
+        return (participant, section_index) in self.completed
+
+    def _write(self, record: dict):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + "\n")
+        if 'output_size' in record:
+            self.output_size = record['output_size']
+
+    def mark_done(self, participant: str, section_index: int, output_size: Optional[int] = None):
+        record = {'participant': participant, 'section': section_index}
+        if output_size is not None:
+            record['output_size'] = output_size
+        with self._lock:
+            self._write(record)
+            self.completed.add((participant, section_index))
+
+    def mark_output_size(self, output_size: int):
+        with self._lock:
+            self._write({'output_size': output_size})
+
+    def __len__(self):
+        return len(self.completed)
@@ -0,0 +1,156 @@
+import re
+from typing import List, Optional, Tuple
+
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count of a text (about 4 characters per token for English).
+    """
+    return len(text) // 4 + 1
+
+
+def _sentence_spans(text: str) -> List[Tuple[int, str]]:
+    # Sentences of the text with their start offset
+    spans, start = [], len(text) - len(text.lstrip())
+    for match in _SENTENCE_END.finditer(text):
+        if match.start() > start:
+            spans.append((start, text[start:match.start()]))
+        start = max(start, match.end())
+    if text[start:].strip():
+        spans.append((start, text[start:].rstrip()))
+    return spans
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence for _, sentence in _sentence_spans(text)]
+
+
+def _split_long_sentence(start: int, sentence: str, max_tokens: int) -> List[Tuple[int, str]]:
+    # Sentences longer than a window are cut between words, keeping the offset of every piece
+    pieces, piece, piece_start = [], [], start
+    for match in re.finditer(r'\S+', sentence):
+        word = match.group()
+        if piece and estimate_tokens(" ".join(piece + [word])) > max_tokens:
+            pieces.append((piece_start, " ".join(piece)))
+            piece = []
+        if not piece:
+            piece_start = start + match.start()
+        piece.append(word)
+    if piece:
+        pieces.append((piece_start, " ".join(piece)))
+    return pieces
+
+
+def chunk_spans(text: str, max_tokens: int, overlap_tokens: int = 0) -> List[Tuple[int, str]]:
+    """
+    Same windows as chunk_text, with the offset in text where every window starts.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return [(0, text)]
+
+    sentences = []
+    for start, sentence in _sentence_spans(text):
+        sentences.extend(_split_long_sentence(start, sentence, max_tokens) if estimate_tokens(sentence) > max_tokens
+                         else [(start, sentence)])
+
+    def joined(units):
+        return " ".join(unit for _, unit in units)
+
+    windows, window = [], []
+    for sentence in sentences:
+        if window and estimate_tokens(joined(window + [sentence])) > max_tokens:
+            windows.append((window[0][0], joined(window)))
+            # Carry the tail of the window over, within the overlap and leaving room for the new sentence
+            overlap = []
+            for previous in reversed(window):
+                candidate = [previous] + overlap
+                if (estimate_tokens(joined(candidate)) > overlap_tokens or
+                        estimate_tokens(joined(candidate + [sentence])) > max_tokens):
+                    break
+                overlap = candidate
+            window = overlap
+        window.append(sentence)
+    if window:
+        windows.append((window[0][0], joined(window)))
+    return windows
+
+
+def chunk_text(text: str, max_tokens: int, overlap_tokens: int = 0) -> List[str]:
+    """
+    Splits a text at sentence boundaries into windows of at most max_tokens tokens.
+
+    Each window starts with the last sentences of the previous one, up to overlap_tokens tokens,
+    so a quote crossing a window boundary is seen whole by at least one window.
+
+    Parameters:
+    - text (str): Text to split.
+    - max_tokens (int): Maximum estimated tokens of a window.
+    - overlap_tokens (int): Maximum estimated tokens repeated from the previous window.
+
+    Returns:
+    - List[str]: Windows in text order (the text itself when it fits in one window).
+    """
+    return [window for _, window in chunk_spans(text, max_tokens, overlap_tokens)]
+
+
+def _find_span(text: str, quote: str, start: int = 0):
+    position = text.find(quote, start)
+    if position != -1:
+        return position, position + len(quote)
+    # The model may normalize whitespace, match on words instead
+    pattern = r'\s+'.join(re.escape(word) for word in quote.split())
+    match = re.compile(pattern).search(text, start) if pattern else None
+    if match:
+        return match.start(), match.end()
+    # Not in the window of the record, e.g. a quote rephrased across windows
+    return _find_span(text, quote) if start else None
+
+
+def _max_confidence(a, b):
+    if a is None or b is None:
+        return a if b is None else b
+    return max(a, b)
+
+
+def merge_quotes(records: List[dict], text: str, starts: Optional[List[int]] = None) -> List[dict]:
+    """
+    Merges the records of the windows of a text: quotes of the same tag that overlap or are
+    only separated by whitespace in the text become a single maximal quote, with the highest
+    confidence of the merged records.
+
+    Parameters:
+    - records (List[dict]): Quote, Tag and Confidence records of all windows.
+    - text (str): The full text the windows were cut from.
+    - starts (List[int]): Optional offset in text of the window of every record (see chunk_spans), quotes
+      are looked up from there so a phrase repeated earlier in the text is not mistaken for them.
+
+    Returns:
+    - List[dict]: Merged records, in text order, followed by the records whose quote was not found in the text.
+    """
+    spans, unmatched = {}, []
+    for i, record in enumerate(records):
+        span = _find_span(text, record['Quote'], starts[i] if starts else 0)
+        if span is None:
+            if record not in unmatched:
+                unmatched.append(record)
+            continue
+        spans.setdefault(record['Tag'], []).append((span[0], span[1], record['Confidence']))
+
+    merged = []
+    for tag, tag_spans in spans.items():
+        tag_spans.sort()
+        start, end, confidence = tag_spans[0]
+        for next_start, next_end, next_confidence in tag_spans[1:]:
+            if next_start <= end or not text[end:next_start].strip():
+                end = max(end, next_end)
+                confidence = _max_confidence(confidence, next_confidence)
+            else:
+                merged.append((start, end, tag, confidence))
+                start, end, confidence = next_start, next_end, next_confidence
+        merged.append((start, end, tag, confidence))
+
+    merged.sort()
+    return [{'Quote': text[start:end], 'Tag': tag, 'Confidence': confidence} for start, end, tag, confidence in merged] + unmatched
@@ -0,0 +1,277 @@
+"""
+Offline evaluation of tagging output against the Condens highlights.
+
+Predicted quotes are aligned to the expert highlights of the same participant by fuzzy span
+overlap: both sides are reduced to word n-grams, the highlights are put in an inverted index of
+(participant, n-gram), and a prediction matches a highlight when they share at least min_overlap
+of the n-grams of the shorter of the two. Only the highlights sharing an n-gram with a prediction
+are ever compared, so scoring is linear in the size of the output.
+
+A prediction is a true positive when it matches a highlight with the same tag; a highlight is
+recalled when a prediction with its tag matches it. Scores are computed per tag, plus an overall
+(micro averaged) row.
+
+Since alignment does not depend on confidence, threshold_sweep re-scores a single output at
+several confidence thresholds. replay_predictions re-runs a tagger on its read-only LLM cache to
+get the output of a previous run (e.g. with a lower threshold) without any LLM call.
+
+Usage:
+    python evaluation.py --predictions output.csv --input data/transcripts_test
+    python evaluation.py --predictions output.csv --participants "P3 Lia O" "P4 Brittanie S" --thresholds 0.5 0.6 0.7 0.8 0.9
+    python evaluation.py --replay-config tagger_config.json --input data/transcripts_test --threshold 0.0 --thresholds 0.5 0.7 0.9
+"""
+import argparse
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+
+HIGHLIGHTS_PATH = "data/Raw Condens Data - highlights_export.csv"
+
+_WORD = re.compile(r"[a-z0-9']+")
+# Condens quotes are exported as "[P3 Lia O] 'quote'"
+_HIGHLIGHT_QUOTE = re.compile(r"^\s*\[[^\]]*\]\s*'(.*)'\s*$", re.S)
+
+
+def participant_id(participant: str) -> str:
+    # Same participant matching as the notebook: "P3 Lia O" and "P3 Lia O." are both P3
+    return str(participant).split(' ')[0]
+
+
+def highlight_text(quote: str) -> str:
+    """
+    Text of a Condens quote, without the participant prefix and the surrounding quotes.
+    """
+    match = _HIGHLIGHT_QUOTE.match(quote)
+    return match.group(1) if match else quote
+
+
+def words(text: str) -> List[str]:
+    return _WORD.findall(str(text).lower().replace('’', "'"))
+
+
+def ngrams(tokens: List[str], n: int) -> set:
+    # Texts shorter than n words are a single n-gram of all their words
+    if len(tokens) < n:
+        return {tuple(tokens)} if tokens else set()
+    return set(zip(*(tokens[i:] for i in range(n))))
+
+
+class HighlightIndex:
+    def __init__(self, highlights: pd.DataFrame, n: int = 3):
+        """
+        Inverted index of the word n-grams of the highlights, by participant.
+
+        Parameters:
+        - highlights (DataFrame): Condens export with Quote, Participants and Tag columns.
+        - n (int): Size of the word n-grams.
+        """
+        self.n = n
+        self.participants = [participant_id(participant) for participant in highlights['Participants']]
+        self.tags = [str(tag).strip().lower() for tag in highlights['Tag']]
+        self.ngrams = [ngrams(words(highlight_text(quote)), n) for quote in highlights['Quote']]
+
+        self.index: Dict[tuple, List[int]] = {}
+        for row, (participant, grams) in enumerate(zip(self.participants, self.ngrams)):
+            for gram in grams:
+                self.index.setdefault((participant, gram), []).append(row)
+
+    def __len__(self) -> int:
+        return len(self.tags)
+
+    def match(self, participant: str, text: str, min_overlap: float = 0.5) -> List[int]:
+        """
+        Rows of the highlights of the participant overlapping the text.
+
+        Parameters:
+        - participant (str): Participant name or id of the text.
+        - text (str): Predicted quote.
+        - min_overlap (float): Minimum share of the n-grams of the shorter text found in the other one.
+
+        Returns:
+        - List[int]: Matching highlight rows.
+        """
+        grams = ngrams(words(text), self.n)
+        participant = participant_id(participant)
+        shared = Counter(row for gram in grams for row in self.index.get((participant, gram), ()))
+        return [row for row, count in shared.items()
+                if count >= min_overlap * min(len(grams), len(self.ngrams[row]))]
+
+
+def load_highlights(path: str = HIGHLIGHTS_PATH) -> pd.DataFrame:
+    return pd.read_csv(path)
+
+
+def align(predictions: pd.DataFrame, index: HighlightIndex, min_overlap: float = 0.5) -> List[List[int]]:
+    """
+    Highlight rows matched by every prediction (Quote and Participant columns), in row order.
+    """
+    return [index.match(participant, quote, min_overlap)
+            for quote, participant in zip(predictions['Quote'], predictions['Participant'])]
+
+
+def score(predictions: pd.DataFrame, index: HighlightIndex, matches: List[List[int]],
+          threshold: Optional[float] = None, participants: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """
+    Per-tag precision, recall and F1 of aligned predictions.
+
+    Parameters:
+    - predictions (DataFrame): Tagging output with Quote, Tag, Confidence and Participant columns.
+    - index (HighlightIndex): Index of the expert highlights.
+    - matches (List[List[int]]): Output of align for the predictions.
+    - threshold (float): Optional minimum confidence of the predictions scored.
+    - participants (Iterable[str]): Participants evaluated, defaults to the participants of the predictions.
+
+    Returns:
+    - DataFrame: Tag, Precision, Recall, F1, Predictions and Highlights columns, one row per tag
+      and a last "ALL" row of micro averaged scores.
+    """
+    evaluated = {participant_id(participant) for participant in (participants if participants is not None else predictions['Participant'])}
+
+    predicted, true_positives = Counter(), Counter()
+    recalled = set()
+    tags = predictions['Tag'].astype(str).str.strip().str.lower()
+    confidences = predictions['Confidence'] if 'Confidence' in predictions else [None] * len(predictions)
+    for tag, confidence, participant, rows in zip(tags, confidences, predictions['Participant'], matches):
+        if participant_id(participant) not in evaluated:
+            continue
+        if threshold is not None and not (pd.notna(confidence) and confidence >= threshold):
+            continue
+        predicted[tag] += 1
+        same_tag = [row for row in rows if index.tags[row] == tag]
+        if same_tag:
+            true_positives[tag] += 1
+            recalled.update(same_tag)
+
+    highlights = Counter(tag for tag, participant in zip(index.tags, index.participants) if participant in evaluated)
+    recalled_by_tag = Counter(index.tags[row] for row in recalled)
+
+    def scores(tag, n_predicted, n_true_positives, n_highlights, n_recalled):
+        precision = n_true_positives / n_predicted if n_predicted else 0.0
+        recall = n_recalled / n_highlights if n_highlights else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        return {'Tag': tag, 'Precision': precision, 'Recall': recall, 'F1': f1,
+                'Predictions': n_predicted, 'Highlights': n_highlights}
+
+    rows = [scores(tag, predicted[tag], true_positives[tag], highlights[tag], recalled_by_tag[tag])
+            for tag in sorted(set(predicted) | set(highlights))]
+    rows.append(scores('ALL', sum(predicted.values()), sum(true_positives.values()),
+                       sum(highlights.values()), len(recalled)))
+    return pd.DataFrame(rows, columns=['Tag', 'Precision', 'Recall', 'F1', 'Predictions', 'Highlights'])
+
+
+def evaluate(predictions: pd.DataFrame, highlights: Optional[pd.DataFrame] = None, n: int = 3, min_overlap: float = 0.5,
+             threshold: Optional[float] = None, participants: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """
+    Per-tag precision, recall and F1 of a tagging output (e.g. pd.read_csv("output.csv")) against the highlights.
+
+    Parameters:
+    - predictions (DataFrame): Tagging output with Quote, Tag, Confidence and Participant columns.
+    - highlights (DataFrame): Condens export, loaded from HIGHLIGHTS_PATH by default.
+    - n (int): Size of the word n-grams used for alignment.
+    - min_overlap (float): Minimum n-gram overlap of a prediction and a highlight.
+    - threshold (float): Optional minimum confidence of the predictions scored.
+    - participants (Iterable[str]): Participants evaluated, defaults to the participants of the predictions.
+
+    Returns:
+    - DataFrame: Per-tag scores, see score.
+    """
+    index = HighlightIndex(highlights if highlights is not None else load_highlights(), n)
+    return score(predictions, index, align(predictions, index, min_overlap), threshold, participants)
+
+
+def threshold_sweep(predictions: pd.DataFrame, thresholds: Iterable[float], highlights: Optional[pd.DataFrame] = None,
+                    n: int = 3, min_overlap: float = 0.5, participants: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """
+    Overall precision, recall and F1 at several confidence thresholds, aligning the predictions only once.
+
+    Returns:
+    - DataFrame: Threshold, Precision, Recall, F1 and Predictions columns.
+    """
+    index = HighlightIndex(highlights if highlights is not None else load_highlights(), n)
+    matches = align(predictions, index, min_overlap)
+    rows = []
+    for threshold in thresholds:
+        overall = score(predictions, index, matches, threshold, participants).iloc[-1]
+        rows.append({'Threshold': threshold, 'Precision': overall['Precision'], 'Recall': overall['Recall'],
+                     'F1': overall['F1'], 'Predictions': overall['Predictions']})
+    return pd.DataFrame(rows)
+
+
+def replay_predictions(tagger, transcripts) -> pd.DataFrame:
+    """
+    Tagging output of a tagger whose cache is in read-only mode, so no LLM call is made.
+
+    Sections whose prompt is not in the cache (e.g. the tagger config changed since the cached run)
+    end up in tagger.failed_sections and are reported.
+    """
+    if tagger.cache is None or not tagger.cache.read_only:
+        raise ValueError("Replay needs a tagger with a read-only LLMResponseCache")
+    failed_before = len(tagger.failed_sections)
+    df = tagger.tag_transcripts(transcripts)
+    missed = len(tagger.failed_sections) - failed_before
+    if missed:
+        print(f"{missed} sections not in the cache were skipped")
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--predictions', default=None, help="Tagging output CSV")
+    parser.add_argument('--replay-config', default=None, help="tag_cli.py config whose LLM cache is replayed instead of reading --predictions")
+    parser.add_argument('--input', default=None,
+                        help="Folder of the .docx transcripts evaluated (tagged with --replay-config), all their participants count in recall")
+    parser.add_argument('--participants', nargs='+', default=None,
+                        help="Participants evaluated with --predictions, instead of --input")
+    parser.add_argument('--threshold', type=float, default=None, help="Tagger threshold of the replay (e.g. 0 to keep every tag for --thresholds)")
+    parser.add_argument('--highlights', default=HIGHLIGHTS_PATH)
+    parser.add_argument('--ngram', type=int, default=3)
+    parser.add_argument('--min-overlap', type=float, default=0.5)
+    parser.add_argument('--thresholds', type=float, nargs='*', default=None, help="Confidence thresholds to sweep")
+    parser.add_argument('--output', default=None, help="Optional CSV the per-tag scores are written to")
+    args = parser.parse_args()
+
+    # Participants without any prediction (e.g. all their sections failed) must still count in recall
+    participants = args.participants
+    if args.replay_config:
+        import tag_cli
+        from transcript_loader import load_transcripts
+
+        if not args.input:
+            parser.error("--replay-config needs --input, the folder of the transcripts to replay")
+        config = tag_cli.load_config(args.replay_config)
+        if not config.get('cache'):
+            parser.error(f"{args.replay_config} has no \"cache\" entry, there are no cached responses to replay")
+        config['cache'] = dict(config['cache'], read_only=True)
+        if args.threshold is not None:
+            config['tagger'] = dict(config.get('tagger', {}), threshold=args.threshold)
+        transcripts = load_transcripts(args.input)
+        participants = list(transcripts)
+        predictions = replay_predictions(tag_cli.build_tagger(config), transcripts)
+    elif args.predictions:
+        predictions = pd.read_csv(args.predictions)
+        if args.input:
+            import tag_cli
+            participants = tag_cli.transcript_participants(args.input)
+        elif participants is None:
+            print("No --input or --participants: only the participants with predictions are evaluated")
+    else:
+        parser.error("one of --predictions or --replay-config is required")
+
+    highlights = load_highlights(args.highlights)
+    scores = evaluate(predictions, highlights, args.ngram, args.min_overlap, participants=participants)
+    with pd.option_context('display.max_rows', None, 'display.width', 120):
+        print(scores.round(3).to_string(index=False))
+    if args.output:
+        scores.to_csv(args.output, index=False)
+
+    if args.thresholds:
+        sweep = threshold_sweep(predictions, args.thresholds, highlights, args.ngram, args.min_overlap, participants)
+        print()
+        print(sweep.round(3).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
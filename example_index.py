@@ -0,0 +1,206 @@
+"""
+Persistent example index for TranscriptTagger.
+
+Saves the FAISS indexes of the training quotes and tags, the quote_tag_map and the embedding
+model id to a folder, so a tagging job loads them from disk instead of re-embedding every
+training quote. Rebuilding only embeds the quotes and tags that are new or changed.
+
+Every build writes its vectors and indexes to new versioned files and then replaces the manifest,
+which names the files of the current version, so an interrupted build leaves the previous index whole.
+
+Usage:
+    quote_tag_map, quote_vector_store, tag_vector_store = build_example_index(
+        "index/", quote_tag_map, embeddings, model_id="amazon.titan-embed-text-v2:0")
+
+    # Later, or in another process
+    quote_tag_map, quote_vector_store, tag_vector_store = load_example_index("index/", embeddings)
+"""
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+
+MANIFEST_FILE = "manifest.json"
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _embed_incrementally(texts: List[str], embeddings, previous_hashes: List[str], previous_vectors: Optional[np.ndarray]) -> np.ndarray:
+    """
+    Vectors of texts, reusing the previous vectors of texts with a known content hash.
+    """
+    previous_rows = {text_hash: row for row, text_hash in enumerate(previous_hashes)}
+    hashes = [content_hash(text) for text in texts]
+    missing = [i for i, text_hash in enumerate(hashes) if text_hash not in previous_rows or previous_vectors is None]
+
+    new_vectors = np.asarray(embeddings.embed_documents([texts[i] for i in missing]), dtype=np.float32) if missing else None
+    dimension = new_vectors.shape[1] if new_vectors is not None else previous_vectors.shape[1]
+
+    vectors = np.empty((len(texts), dimension), dtype=np.float32)
+    missing_rows = {i: row for row, i in enumerate(missing)}
+    for i, text_hash in enumerate(hashes):
+        vectors[i] = new_vectors[missing_rows[i]] if i in missing_rows else previous_vectors[previous_rows[text_hash]]
+
+    # Same normalization as FAISS.from_texts(..., normalize_L2=True)
+    faiss.normalize_L2(vectors)
+    print(f"Embedded {len(missing)} new texts, reused {len(texts) - len(missing)}")
+    return vectors
+
+
+def _vectors_checksum(vectors: np.ndarray) -> str:
+    return hashlib.sha256(np.ascontiguousarray(vectors).tobytes()).hexdigest()
+
+
+def _write_index(index_dir: str, file_name: str, vectors: np.ndarray):
+    np.save(os.path.join(index_dir, f"{file_name}.npy"), vectors)
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    faiss.write_index(index, os.path.join(index_dir, f"{file_name}.faiss"))
+
+
+def _file_name(manifest: dict, name: str) -> str:
+    # Indexes saved before versioned files were introduced are named after the index
+    return manifest.get('files', {}).get(name, name)
+
+
+def _previous_vectors(index_dir: str, manifest: Optional[dict], name: str) -> Tuple[List[str], Optional[np.ndarray]]:
+    """
+    Hashes and vectors of the previous build, or none if they do not match each other.
+    """
+    if manifest is None:
+        return [], None
+    hashes = manifest[f"{name}_hashes"]
+    path = os.path.join(index_dir, f"{_file_name(manifest, name)}.npy")
+    vectors = np.load(path, mmap_mode='r') if os.path.exists(path) else None
+    checksum = manifest.get(f"{name}_checksum")
+    if (vectors is None or vectors.ndim != 2 or vectors.shape[0] != len(hashes) or
+            (checksum is not None and _vectors_checksum(vectors) != checksum)):
+        print(f"Stored {name} vectors do not match the manifest, embedding every {name} again")
+        return [], None
+    return hashes, vectors
+
+
+def _read_index(index_dir: str, file_name: str):
+    # Memory-map the index instead of reading it in memory, when supported by the installed faiss
+    flag = getattr(faiss, 'IO_FLAG_MMAP_IFC', getattr(faiss, 'IO_FLAG_MMAP', 0))
+    return faiss.read_index(os.path.join(index_dir, f"{file_name}.faiss"), flag)
+
+
+def _remove_files(index_dir: str, file_name: str):
+    for extension in (".npy", ".faiss"):
+        path = os.path.join(index_dir, file_name + extension)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _vector_store(index, texts: List[str], embeddings) -> FAISS:
+    ids = [content_hash(text) for text in texts]
+    return FAISS(embedding_function=embeddings,
+                 index=index,
+                 docstore=InMemoryDocstore({doc_id: Document(page_content=text) for doc_id, text in zip(ids, texts)}),
+                 index_to_docstore_id=dict(enumerate(ids)),
+                 normalize_L2=True)
+
+
+def _read_manifest(index_dir: str) -> Optional[dict]:
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def build_example_index(index_dir: str, quote_tag_map: Dict[str, str], embeddings, model_id: str) -> Tuple[Dict[str, str], FAISS, FAISS]:
+    """
+    Builds or updates the example index in index_dir and loads it.
+
+    Quotes and tags already embedded by the same model (same content hash) are not embedded again.
+    A different model id rebuilds the whole index.
+
+    Parameters:
+    - index_dir (str): Folder of the index, created if needed.
+    - quote_tag_map (Dict[str, str]): Training quotes and their tag.
+    - embeddings: LangChain embeddings model (e.g. BedrockEmbeddings).
+    - model_id (str): Id of the embedding model, stored to detect model changes.
+
+    Returns:
+    - Tuple: quote_tag_map, quote_vector_store and tag_vector_store, as used by TranscriptTagger.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    manifest = _read_manifest(index_dir)
+    if manifest is not None and manifest['model_id'] != model_id:
+        print(f"Embedding model changed from {manifest['model_id']} to {model_id}, rebuilding the index")
+        manifest = None
+
+    quotes = list(quote_tag_map.keys())
+    tags = sorted(set(tag.lower() for tag in quote_tag_map.values()))
+
+    # New files for this build, the files of the previous manifest are only read
+    version = manifest.get('version', 0) + 1 if manifest else 1
+    files = {name: f"{name}-{version}" for name in ("quotes", "tags")}
+    checksums = {}
+
+    for name, texts in (("quotes", quotes), ("tags", tags)):
+        previous_hashes, previous_vectors = _previous_vectors(index_dir, manifest, name)
+        vectors = _embed_incrementally(texts, embeddings, previous_hashes, previous_vectors)
+        del previous_vectors
+        _write_index(index_dir, files[name], vectors)
+        checksums[name] = _vectors_checksum(vectors)
+
+    previous_files = [_file_name(manifest, name) for name in files] if manifest else []
+    manifest = {
+        'model_id': model_id,
+        'version': version,
+        'files': files,
+        'quote_tag_map': quote_tag_map,
+        'quotes_hashes': [content_hash(quote) for quote in quotes],
+        'quotes_checksum': checksums['quotes'],
+        'tags': tags,
+        'tags_hashes': [content_hash(tag) for tag in tags],
+        'tags_checksum': checksums['tags'],
+    }
+    # The manifest is replaced last, an interrupted build leaves the previous manifest and its files untouched
+    tmp_path = os.path.join(index_dir, MANIFEST_FILE + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(index_dir, MANIFEST_FILE))
+
+    for file_name in previous_files:
+        if file_name not in files.values():
+            _remove_files(index_dir, file_name)
+
+    return load_example_index(index_dir, embeddings)
+
+
+def load_example_index(index_dir: str, embeddings, model_id: Optional[str] = None) -> Tuple[Dict[str, str], FAISS, FAISS]:
+    """
+    Loads an example index saved by build_example_index without embedding anything.
+
+    Parameters:
+    - index_dir (str): Folder of the index.
+    - embeddings: LangChain embeddings model, used to embed the sections at tagging time.
+    - model_id (str): If given, checked against the model the index was built with.
+
+    Returns:
+    - Tuple: quote_tag_map, quote_vector_store and tag_vector_store, as used by TranscriptTagger.
+    """
+    manifest = _read_manifest(index_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No example index found in {index_dir}")
+    if model_id is not None and manifest['model_id'] != model_id:
+        raise ValueError(f"Index was built with {manifest['model_id']}, not {model_id}")
+
+    quote_tag_map = manifest['quote_tag_map']
+    quote_vector_store = _vector_store(_read_index(index_dir, _file_name(manifest, "quotes")), list(quote_tag_map.keys()), embeddings)
+    tag_vector_store = _vector_store(_read_index(index_dir, _file_name(manifest, "tags")), manifest['tags'], embeddings)
+
+    return quote_tag_map, quote_vector_store, tag_vector_store
@@ -0,0 +1,144 @@
+"""
+Deterministic offline stand-ins for the Bedrock chat model and embeddings, used by the benchmarks
+and by the "fake" provider of tag_cli.py to run the pipeline without AWS access.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+
+
+class FakeMessage:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class ThrottlingException(Exception):
+    """Raised by FakeChatModel above its request rate, like the Bedrock error of the same name."""
+
+
+class FakeChatModel:
+    def __init__(self, tags: List[str], latency: float = 0.0, latency_per_1k_tokens: float = 0.0, model_id: str = "fake-chat-model",
+                 max_requests_per_second: Optional[float] = None):
+        """
+        Chat model answering with a deterministic tagging of the last input text of the prompt.
+
+        Parameters:
+        - tags (List[str]): Tags used in the answers.
+        - latency (float): Fixed seconds per call.
+        - latency_per_1k_tokens (float): Extra seconds per 1000 prompt tokens (4 characters per token).
+        - model_id (str): Model id reported to the tagger (cache keys).
+        - max_requests_per_second (float): Optional quota of the endpoint, requests above it in any
+          one-second window raise ThrottlingException.
+        """
+        self.tags = sorted(tags)
+        self.latency = latency
+        self.latency_per_1k_tokens = latency_per_1k_tokens
+        self.model_id = model_id
+        self.max_requests_per_second = max_requests_per_second
+        self.calls = 0
+        self.throttles = 0
+        self.prompt_bytes = 0
+        self._accepted = deque()
+        self._lock = threading.Lock()
+
+    def _admit(self):
+        # Sliding one-second window of the accepted requests
+        if self.max_requests_per_second is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            while self._accepted and now - self._accepted[0] >= 1.0:
+                self._accepted.popleft()
+            if len(self._accepted) >= self.max_requests_per_second:
+                self.throttles += 1
+                raise ThrottlingException("Too many requests, please wait before trying again.")
+            self._accepted.append(now)
+
+    @staticmethod
+    def _prompt_text(prompt) -> str:
+        if isinstance(prompt, str):
+            return prompt
+        return "".join(block['text'] for message in prompt for block in message['content'])
+
+    def _delay(self, text: str) -> float:
+        return self.latency + self.latency_per_1k_tokens * len(text) / 4000
+
+    def _answer(self, text: str) -> FakeMessage:
+        with self._lock:
+            self.calls += 1
+            self.prompt_bytes += len(text.encode('utf-8'))
+
+        # Batched prompts have numbered input blocks, answered with a 'section' field
+        sections = re.findall(r'<input_text id="(\d+)">\n(.*?)\n</input_text>', text, re.S)
+        if not sections:
+            sections = [(None, text.rsplit('<input_text>', 1)[-1].split('</input_text>', 1)[0].strip())]
+
+        items = []
+        for section_id, quote in sections:
+            rng = random.Random(_seed(quote))
+            sentences = [sentence for sentence in re.split(r'(?<=[.!?])\s+', quote) if sentence]
+            for _ in range(rng.randint(0, 2) if sentences else 0):
+                item = {'quote': rng.choice(sentences), 'tag': rng.choice(self.tags), 'confidence': round(rng.uniform(0.5, 1.0), 2)}
+                if section_id is not None:
+                    item['section'] = int(section_id)
+                items.append(item)
+        return FakeMessage(json.dumps(items))
+
+    def invoke(self, prompt) -> FakeMessage:
+        self._admit()
+        text = self._prompt_text(prompt)
+        time.sleep(self._delay(text))
+        return self._answer(text)
+
+    async def ainvoke(self, prompt) -> FakeMessage:
+        self._admit()
+        text = self._prompt_text(prompt)
+        await asyncio.sleep(self._delay(text))
+        return self._answer(text)
+
+
+class FakeEmbeddings(Embeddings):
+    def __init__(self, size: int = 256, latency: float = 0.0, latency_per_text: float = 0.0):
+        """
+        Embeddings built from hashed word counts, so similar texts get similar vectors.
+
+        Parameters:
+        - size (int): Vector size.
+        - latency (float): Fixed seconds per embedding call.
+        - latency_per_text (float): Extra seconds per embedded text.
+        """
+        self.size = size
+        self.latency = latency
+        self.latency_per_text = latency_per_text
+        self.calls = 0
+        self.texts = 0
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            vector[_seed(word) % self.size] += 1.0
+        if not vector.any():
+            vector[0] = 1.0
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts += len(texts)
+        time.sleep(self.latency + self.latency_per_text * len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
@@ -0,0 +1,185 @@
+"""
+Hot-path instrumentation of the tagging pipeline.
+
+TranscriptTagger reports per-stage wall time (retrieval, prompt, llm, parse), counters (LLM calls,
+cache hits, failed sections) and per-call values (prompt and response tokens, examples per section)
+to an Instrumentation. By default it uses NULL_INSTRUMENTATION, whose methods do nothing.
+
+Usage:
+    instrumentation = Instrumentation(profile=True)
+    tagger = TranscriptTagger(..., instrumentation=instrumentation)
+
+    with instrumentation.run():
+        df_out = tagger.tag_transcripts(test_transcripts)
+
+    print(instrumentation.summary())
+    instrumentation.save_report("run_report.json", extra=tagger.run_stats())
+"""
+import cProfile
+import contextlib
+import io
+import json
+import pstats
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class _StageTimer:
+    __slots__ = ('instrumentation', 'name', 'start')
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.instrumentation.add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Instrumentation:
+    enabled = True
+
+    def __init__(self, hooks: Optional[List] = None, profile: bool = False, profile_path: Optional[str] = None):
+        """
+        Parameters:
+        - hooks (List): Objects notified of every measure, through any of the optional methods
+          on_stage(name, seconds), on_count(name, value) and on_value(name, value).
+        - profile (bool): Capture a cProfile of the calling thread during run().
+        - profile_path (str): Optional file the cProfile stats are dumped to.
+        """
+        self.hooks = hooks or []
+        self.profile = profile
+        self.profile_path = profile_path
+        self.timings: Dict[str, List[float]] = {}
+        self.counters: Dict[str, int] = {}
+        self.values: Dict[str, List[float]] = {}
+        self.wall_time = None
+        self.profile_stats = None
+        self._lock = threading.Lock()
+
+    def stage(self, name: str) -> _StageTimer:
+        """
+        Context manager measuring the wall time of a stage.
+        """
+        return _StageTimer(self, name)
+
+    def add_time(self, name: str, seconds: float):
+        with self._lock:
+            self.timings.setdefault(name, []).append(seconds)
+        for hook in self.hooks:
+            if hasattr(hook, 'on_stage'):
+                hook.on_stage(name, seconds)
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        for hook in self.hooks:
+            if hasattr(hook, 'on_count'):
+                hook.on_count(name, value)
+
+    def record(self, name: str, value: float):
+        with self._lock:
+            self.values.setdefault(name, []).append(value)
+        for hook in self.hooks:
+            if hasattr(hook, 'on_value'):
+                hook.on_value(name, value)
+
+    @contextlib.contextmanager
+    def run(self):
+        """
+        Measures the total wall time of a run, with a cProfile capture when profile is set.
+        """
+        profiler = cProfile.Profile() if self.profile else None
+        start = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            yield self
+        finally:
+            if profiler:
+                profiler.disable()
+                output = io.StringIO()
+                pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(30)
+                self.profile_stats = output.getvalue()
+                if self.profile_path:
+                    profiler.dump_stats(self.profile_path)
+            self.wall_time = time.perf_counter() - start
+
+    @staticmethod
+    def _describe(values: List[float]) -> dict:
+        ordered = sorted(values)
+        return {
+            'count': len(ordered),
+            'total': sum(ordered),
+            'mean': sum(ordered) / len(ordered),
+            'p50': ordered[len(ordered) // 2],
+            'p99': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+            'max': ordered[-1],
+        }
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                'wall_time': self.wall_time,
+                'stages': {name: self._describe(values) for name, values in self.timings.items()},
+                'counters': dict(self.counters),
+                'values': {name: self._describe(values) for name, values in self.values.items()},
+            }
+
+    def save_report(self, path: str, extra: Optional[dict] = None):
+        """
+        Writes the report as JSON, with optional extra entries (e.g. TranscriptTagger.run_stats()).
+        """
+        report = self.report()
+        if extra:
+            report.update(extra)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    def summary(self) -> str:
+        """
+        Summary table of the stages, counters and values.
+        """
+        report = self.report()
+        lines = [f"{'stage':<12}{'calls':>8}{'total s':>10}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}"]
+        for name, stats in report['stages'].items():
+            lines.append(f"{name:<12}{stats['count']:>8}{stats['total']:>10.2f}{stats['mean'] * 1e3:>10.1f}"
+                         f"{stats['p50'] * 1e3:>10.1f}{stats['p99'] * 1e3:>10.1f}")
+        for name, stats in report['values'].items():
+            lines.append(f"{name:<20} total {stats['total']:.0f}, mean {stats['mean']:.1f}, max {stats['max']:.0f}")
+        for name, value in report['counters'].items():
+            lines.append(f"{name:<20} {value}")
+        if report['wall_time'] is not None:
+            lines.append(f"{'wall time':<20} {report['wall_time']:.2f}s")
+        return "\n".join(lines)
+
+
+class NullInstrumentation:
+    """
+    Instrumentation that does nothing, the default of TranscriptTagger.
+    """
+    enabled = False
+    _null_stage = contextlib.nullcontext()
+
+    def stage(self, name: str):
+        return self._null_stage
+
+    def add_time(self, name: str, seconds: float):
+        pass
+
+    def count(self, name: str, value: int = 1):
+        pass
+
+    def record(self, name: str, value: float):
+        pass
+
+    def run(self):
+        return self._null_stage
+
+
+NULL_INSTRUMENTATION = NullInstrumentation()
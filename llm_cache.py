@@ -0,0 +1,127 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+class CacheMissError(LookupError):
+    """Raised when a prompt is not cached and the cache is in replay (read-only) mode."""
+
+
+def model_id_of(llm_instance) -> str:
+    """
+    Best effort model id of an LLM instance, looking through wrappers such as `.with_retry()`.
+    """
+    instance = llm_instance
+    while instance is not None:
+        for attribute in ('model_id', 'model_name', 'model'):
+            value = getattr(instance, attribute, None)
+            if isinstance(value, str) and value:
+                return value
+        instance = getattr(instance, 'bound', None)
+    return type(llm_instance).__name__
+
+
+class LLMResponseCache:
+    def __init__(self, path: str, max_entries: Optional[int] = None, max_age: Optional[float] = None, read_only: bool = False):
+        """
+        On-disk SQLite cache of LLM responses, keyed by a hash of the model id and the full prompt.
+
+        Parameters:
+        - path (str): Path of the SQLite file.
+        - max_entries (int): Maximum number of responses kept, least recently used are evicted first.
+          Eviction runs every max_entries // 10 inserts, so the cache can exceed it by 10% in between.
+        - max_age (float): Maximum age in seconds of a cached response.
+        - read_only (bool): Replay mode, the cache is never written and misses raise CacheMissError in the tagger.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.read_only = read_only
+        self.hits = 0
+        self.misses = 0
+        self._inserts_since_evict = 0
+        self._evict_every = max(1, max_entries // 10) if max_entries else None
+
+        # A single connection shared by all threads, serialized with a lock.
+        # SQLite itself handles locking between processes.
+        self._lock = threading.Lock()
+        if read_only:
+            self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30, check_same_thread=False)
+        else:
+            self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model_id TEXT, response TEXT, created_at REAL, accessed_at REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+            self._conn.commit()
+            self.evict()
+
+    @staticmethod
+    def key(model_id: str, prompt) -> str:
+        if not isinstance(prompt, str):
+            # Chat style prompts (list of messages) are hashed through their canonical JSON
+            prompt = json.dumps(prompt, sort_keys=True, default=str)
+        return hashlib.sha256(f"{model_id}\0{prompt}".encode('utf-8')).hexdigest()
+
+    def get(self, model_id: str, prompt) -> Optional[str]:
+        key = self.key(model_id, prompt)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.max_age is not None and now - row[1] > self.max_age):
+                self.misses += 1
+                return None
+            self.hits += 1
+            if not self.read_only:
+                self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+        return row[0]
+
+    def set(self, model_id: str, prompt, response: str):
+        if self.read_only:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model_id, response, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (self.key(model_id, prompt), model_id, response, now, now),
+            )
+            self._conn.commit()
+            self._inserts_since_evict += 1
+            evict = self._evict_every is not None and self._inserts_since_evict >= self._evict_every
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """
+        Drops responses older than max_age and the least recently used ones above max_entries.
+        """
+        if self.read_only:
+            return
+        with self._lock:
+            if self.max_age is not None:
+                self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age,))
+            if self.max_entries is not None:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            self._conn.commit()
+            self._inserts_since_evict = 0
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self)}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
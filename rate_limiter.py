@@ -0,0 +1,193 @@
+"""
+Client-side rate limiting for the LLM calls of TranscriptTagger.
+
+AdaptiveRateLimiter keeps requests/min and tokens/min under the configured quota with token
+buckets, adapts the number of requests in flight to the throttles it observes (AIMD: +1 after a
+window of successes, halved on a throttle) and hands out free slots to the smallest prompts first.
+A throttled call is retried with exponential backoff and jitter, during which no other request
+is started, instead of every worker retrying blindly.
+
+When using it, disable the retries of the client itself so throttles reach the limiter, e.g.
+`Config(retries={'max_attempts': 1})` for Bedrock and no `.with_retry()` on the LLM instance.
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+from typing import Optional
+
+
+THROTTLING_MARKERS = ('throttl', 'too many requests', 'rate exceeded', 'toomanyrequests', '429')
+
+
+def is_throttling_error(error: Exception) -> bool:
+    """
+    True if an exception looks like a throttling error (e.g. Bedrock ThrottlingException).
+    """
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in THROTTLING_MARKERS)
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, burst_seconds: float = 10.0):
+        """
+        Token bucket refilled continuously at rate_per_minute, holding at most burst_seconds of quota.
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """
+        Seconds until amount tokens are available (0 if they are available now).
+        """
+        self._refill(now)
+        # A request larger than the bucket waits for a full bucket instead of forever
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def consume(self, amount: float, now: float):
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+
+class AdaptiveRateLimiter:
+    def __init__(self, requests_per_minute: float, tokens_per_minute: Optional[float] = None,
+                 max_concurrency: int = 8, min_concurrency: int = 1, max_retries: int = 8,
+                 base_delay: float = 1.0, max_delay: float = 60.0, burst_seconds: float = 10.0):
+        """
+        Parameters:
+        - requests_per_minute (float): Request quota.
+        - tokens_per_minute (float): Optional token quota, checked against the estimated tokens of each request.
+        - max_concurrency (int): Upper bound of requests in flight.
+        - min_concurrency (int): Lower bound of requests in flight after throttles.
+        - max_retries (int): Retries of a throttled request before the error is raised.
+        - base_delay (float): First backoff delay in seconds, doubled on every retry.
+        - max_delay (float): Maximum backoff delay in seconds.
+        - burst_seconds (float): Seconds of quota that can be used in a burst.
+        """
+        self.request_bucket = TokenBucket(requests_per_minute, burst_seconds)
+        self.token_bucket = TokenBucket(tokens_per_minute, burst_seconds) if tokens_per_minute else None
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.concurrency = float(max_concurrency)
+        self.in_flight = 0
+        self.requests = 0
+        self.throttles = 0
+        self.retries = 0
+
+        self._successes = 0
+        self._paused_until = 0.0
+        self._queue = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def acquire(self, tokens: float = 0, priority: Optional[float] = None):
+        """
+        Blocks until the request can start. Waiting requests are served by ascending priority
+        (the estimated tokens by default, so short sections go first), then in arrival order.
+        """
+        entry = (tokens if priority is None else priority, next(self._sequence))
+        with self._condition:
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = None
+                    if self._queue[0] == entry and self.in_flight < int(self.concurrency):
+                        wait = max(self._paused_until - now,
+                                   self.request_bucket.wait_time(1, now),
+                                   self.token_bucket.wait_time(tokens, now) if self.token_bucket else 0.0)
+                        if wait <= 0:
+                            break
+                    self._condition.wait(timeout=wait)
+            finally:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                # The next waiting request may be able to start as well
+                self._condition.notify_all()
+
+            now = time.monotonic()
+            self.request_bucket.consume(1, now)
+            if self.token_bucket:
+                self.token_bucket.consume(tokens, now)
+            self.in_flight += 1
+            self.requests += 1
+
+    def release(self, throttled: bool = False):
+        """
+        Ends a request started with acquire, adapting the concurrency to the outcome.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                # Multiplicative decrease
+                self.throttles += 1
+                self._successes = 0
+                self.concurrency = max(float(self.min_concurrency), self.concurrency / 2)
+            else:
+                # Additive increase, one more slot after a full window of successes
+                self._successes += 1
+                if self._successes >= int(self.concurrency):
+                    self._successes = 0
+                    self.concurrency = min(float(self.max_concurrency), self.concurrency + 1)
+            self._condition.notify_all()
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.5)
+        with self._condition:
+            self.retries += 1
+            # Hold every new request during the backoff so throttles do not turn into a retry storm
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        return delay
+
+    def call(self, function, tokens: float = 0):
+        """
+        Calls function() within the limits, retrying throttling errors with backoff.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire(tokens)
+            try:
+                result = function()
+            except Exception as e:
+                throttled = is_throttling_error(e)
+                self.release(throttled)
+                if not throttled or attempt == self.max_retries:
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+            self.release()
+            return result
+
+    async def acall(self, coroutine_function, tokens: float = 0):
+        """
+        Async version of call, coroutine_function() is awaited within the limits.
+        """
+        for attempt in range(self.max_retries + 1):
+            await asyncio.to_thread(self.acquire, tokens)
+            try:
+                result = await coroutine_function()
+            except Exception as e:
+                throttled = is_throttling_error(e)
+                self.release(throttled)
+                if not throttled or attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            self.release()
+            return result
+
+    def stats(self) -> dict:
+        return {'requests': self.requests, 'throttles': self.throttles, 'retries': self.retries,
+                'concurrency': int(self.concurrency), 'in_flight': self.in_flight}
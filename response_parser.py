@@ -0,0 +1,142 @@
+import ast
+import json
+import re
+import threading
+from typing import Iterable, List, Optional
+
+
+# Bare JSON literals, replaced by their Python equivalent before ast.literal_eval
+_JSON_LITERALS = re.compile(r'\b(true|false|null)\b')
+_PYTHON_LITERALS = {'true': 'True', 'false': 'False', 'null': 'None'}
+
+
+class ResponseParser:
+    def __init__(self, known_tags: Iterable[str]):
+        """
+        Tolerant parser of the JSON array returned by the language model.
+
+        Accepts JSON or Python style quoting (the prompt examples use single quotes), arrays
+        wrapped in prose or code fences and a single object instead of an array. Items are
+        validated against the known tags and returned as plain records.
+
+        Parameters:
+        - known_tags (Iterable[str]): Tags the model is allowed to use (compared case-insensitively).
+        """
+        self.known_tags = {tag.strip().lower(): tag for tag in known_tags}
+        self.responses = 0
+        self.failures = 0
+        self.invalid_items = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _balanced(response: str, start: int) -> Optional[str]:
+        # Slice from the bracket at start to its matching closing bracket, skipping quoted strings
+        closing = {'[': ']', '{': '}'}
+        stack, quote, escaped = [], None, False
+        for i in range(start, len(response)):
+            char = response[i]
+            if quote:
+                if escaped:
+                    escaped = False
+                elif char == '\\':
+                    escaped = True
+                elif char == quote:
+                    quote = None
+            elif char in ('"', "'"):
+                quote = char
+            elif char in closing:
+                stack.append(closing[char])
+            elif char in (']', '}'):
+                if not stack or stack.pop() != char:
+                    return None
+                if not stack:
+                    return response[start:i + 1]
+        return None
+
+    @classmethod
+    def _decode(cls, response: str, start: int):
+        try:
+            return json.JSONDecoder().raw_decode(response, start)[0]
+        except ValueError:
+            pass
+        candidate = cls._balanced(response, start)
+        if candidate is None:
+            return None
+        for text in (candidate, _JSON_LITERALS.sub(lambda m: _PYTHON_LITERALS[m.group(1)], candidate)):
+            try:
+                return ast.literal_eval(text)
+            except (ValueError, SyntaxError, MemoryError, RecursionError):
+                continue
+        return None
+
+    @classmethod
+    def extract(cls, response: str):
+        """
+        Returns the Python value of the first JSON array (or object) in the response, None if there is none.
+
+        Every '[' or '{' is tried in turn, so brackets in the surrounding prose (e.g. "[1]" or
+        "[grocery]") are skipped. An array of objects is preferred over other arrays, which are
+        only returned if nothing better is found.
+        """
+        fallback = None
+        for match in re.finditer(r'[\[{]', response):
+            value = cls._decode(response, match.start())
+            if isinstance(value, dict) or (isinstance(value, list) and all(isinstance(item, dict) for item in value)):
+                return value
+            if isinstance(value, list) and fallback is None:
+                fallback = value
+        return fallback
+
+    def _record(self, item) -> Optional[dict]:
+        if not isinstance(item, dict):
+            return None
+        quote, tag = item.get('quote'), item.get('tag')
+        if not isinstance(quote, str) or not quote.strip() or not isinstance(tag, str):
+            return None
+        tag = self.known_tags.get(tag.strip().lower())
+        if tag is None:
+            return None
+        try:
+            confidence = float(item.get('confidence'))
+        except (TypeError, ValueError):
+            confidence = None
+
+        record = {'Quote': quote.strip(), 'Tag': tag, 'Confidence': confidence}
+        if 'section' in item:
+            record['section'] = item['section']
+        return record
+
+    def parse(self, response: Optional[str]) -> Optional[List[dict]]:
+        """
+        Parses a response into records with Quote, Tag and Confidence keys (and section in batching mode).
+
+        Returns:
+        - List[dict]: Valid records, possibly empty. Invalid items are dropped and counted in invalid_items.
+        - None: The response does not contain a JSON array, counted in failures.
+        """
+        with self._lock:
+            self.responses += 1
+
+        value = self.extract(response) if response else []
+        if isinstance(value, dict):
+            value = [value]
+        if not isinstance(value, list):
+            with self._lock:
+                self.failures += 1
+            return None
+
+        records = [self._record(item) for item in value]
+        valid = [record for record in records if record is not None]
+        with self._lock:
+            self.invalid_items += len(records) - len(valid)
+        return valid
+
+    def count_invalid(self, count: int = 1):
+        """
+        Counts items dropped after parsing, e.g. batch records without a valid section id.
+        """
+        with self._lock:
+            self.invalid_items += count
+
+    def stats(self) -> dict:
+        return {'responses': self.responses, 'failures': self.failures, 'invalid_items': self.invalid_items}
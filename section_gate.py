@@ -0,0 +1,338 @@
+"""
+Local pre-filter of the sections sent to the language model.
+
+Filler answers ("Yeah.", "Okay, sure.") cost a full retrieval and LLM call for no tag. SectionGate
+scores every section with a small logistic regression over its nearest-neighbour similarity to the
+tagged quotes of quote_vector_store, its length and its hashed words, and TranscriptTagger skips the
+sections scoring below the threshold (or tags them with a cheaper tagger). The section vectors of the
+gate are reused by batched retrieval, so gating costs a FAISS search and no extra embedding call.
+
+The training labels come from quote_tag_map: a section of a training transcript is positive when it
+contains one of the tagged quotes. tune_threshold measures, on transcripts with expert highlights, how
+many sections and highlights every threshold would skip, and how much recall an existing output
+would lose, so the threshold is picked against a known recall loss.
+
+Usage:
+    gate = SectionGate(quote_vector_store, quote_tag_map).fit(train_transcripts)
+    threshold, sweep = tune_threshold(gate, test_transcripts, highlights, predictions=pd.read_csv("output.csv"))
+    gate.threshold = threshold
+    gate.save("section_gate.npz")
+
+    tagger = TranscriptTagger(..., section_gate=gate)
+
+    # Offline, with the models of a tag_cli.py config
+    python section_gate.py --config tagger_config.json --train data/transcripts_train --test data/transcripts_test --predictions output.csv --save section_gate.npz
+"""
+import argparse
+import threading
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import evaluation
+from transcript_loader import TranscriptSection
+
+
+class SectionGate:
+    def __init__(self, quote_vector_store, quote_tag_map: Dict[str, str], threshold: float = 0.1, k: int = 5,
+                 hash_size: int = 512, min_overlap: float = 0.5):
+        """
+        Parameters:
+        - quote_vector_store: FAISS store of the tagged quotes (the one of TranscriptTagger).
+        - quote_tag_map (Dict[str, str]): Tagged quotes, used to label the training sections.
+        - threshold (float): Sections with a tag probability below the threshold are gated.
+        - k (int): Number of neighbours of the similarity features.
+        - hash_size (int): Number of hashed word features.
+        - min_overlap (float): Share of the words n-grams of a quote a section must contain to be labelled positive.
+        """
+        self.quote_vector_store = quote_vector_store
+        self.quote_tag_map = quote_tag_map
+        self.threshold = threshold
+        self.k = k
+        self.hash_size = hash_size
+        self.min_overlap = min_overlap
+
+        self.weights = None
+        self.bias = 0.0
+        self.mean = None
+        self.std = None
+
+        self.sections = 0
+        self.gated = 0
+        self.estimated_tokens_saved = 0
+        self._lock = threading.Lock()
+
+    @property
+    def embeddings(self):
+        store = self.quote_vector_store
+        return getattr(store, 'embeddings', None) or getattr(store, 'embedding_function', None)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def _similarities(self, vectors, exclude: Optional[List[set]] = None) -> np.ndarray:
+        """
+        Highest and mean cosine similarity of every vector to its k nearest quotes, skipping the
+        FAISS rows of exclude (the quotes a training section was labelled from).
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        extra = max((len(rows) for rows in exclude), default=0) if exclude else 0
+        distances, indices = self.quote_vector_store.index.search(vectors, self.k + extra)
+
+        features = np.zeros((len(vectors), 2), dtype=np.float32)
+        for i, (row_distances, row_indices) in enumerate(zip(distances, indices)):
+            # Squared L2 distance of unit vectors is 2 - 2 cos
+            similarities = [1 - distance / 2 for distance, row in zip(row_distances, row_indices)
+                            if row != -1 and not (exclude and row in exclude[i])][:self.k]
+            if similarities:
+                features[i] = (similarities[0], np.mean(similarities))
+        return features
+
+    def _text_features(self, texts: List[str]) -> np.ndarray:
+        features = np.zeros((len(texts), self.hash_size + 1), dtype=np.float32)
+        for i, text in enumerate(texts):
+            words = evaluation.words(text)
+            features[i, 0] = np.log1p(len(words))
+            for word in set(words):
+                features[i, 1 + zlib.crc32(word.encode('utf-8')) % self.hash_size] = 1.0
+        return features
+
+    def features(self, texts: List[str], vectors, exclude: Optional[List[set]] = None) -> np.ndarray:
+        return np.hstack([self._similarities(vectors, exclude), self._text_features(texts)])
+
+    def _quote_rows(self) -> Dict[str, int]:
+        store = self.quote_vector_store
+        return {store.docstore.search(doc_id).page_content: row for row, doc_id in store.index_to_docstore_id.items()}
+
+    def training_set(self, transcripts: Dict[str, List[TranscriptSection]], n: int = 3) -> Tuple[List[str], np.ndarray, List[set]]:
+        """
+        Answers of the training transcripts, their labels and the FAISS rows of the quotes they contain.
+        """
+        quote_rows = self._quote_rows()
+        quote_grams = [evaluation.ngrams(evaluation.words(evaluation.highlight_text(quote)), n) for quote in self.quote_tag_map]
+        rows = [quote_rows.get(quote) for quote in self.quote_tag_map]
+        index = {}
+        for quote_index, grams in enumerate(quote_grams):
+            for gram in grams:
+                index.setdefault(gram, []).append(quote_index)
+
+        texts, labels, exclude = [], [], []
+        for transcript in transcripts.values():
+            for section in transcript:
+                grams = evaluation.ngrams(evaluation.words(section.a), n)
+                shared = Counter(quote_index for gram in grams for quote_index in index.get(gram, ()))
+                contained = [quote_index for quote_index, count in shared.items()
+                             if count >= self.min_overlap * len(quote_grams[quote_index])]
+                texts.append(section.a)
+                labels.append(1.0 if contained else 0.0)
+                exclude.append({rows[quote_index] for quote_index in contained if rows[quote_index] is not None})
+        return texts, np.asarray(labels, dtype=np.float32), exclude
+
+    def fit(self, transcripts: Dict[str, List[TranscriptSection]], epochs: int = 300, learning_rate: float = 0.5,
+            l2: float = 1e-3) -> 'SectionGate':
+        """
+        Trains the classifier on the sections of transcripts whose highlights are in quote_tag_map
+        (e.g. the training transcripts of the notebook).
+
+        The similarity features of a training section skip the quotes it contains, which would
+        otherwise be its own nearest neighbours and are never in the index at tagging time.
+        Classes are weighted to the same total weight.
+
+        Returns:
+        - SectionGate: self, trained.
+        """
+        texts, labels, exclude = self.training_set(transcripts)
+        if len(set(labels.tolist())) < 2:
+            raise ValueError("Training sections need both tagged and untagged sections")
+        features = self.features(texts, self.embed(texts), exclude)
+
+        # Only the similarity and length features are standardized, the word features stay 0 or 1
+        # so that rare words do not get huge values
+        self.mean = np.zeros(features.shape[1], dtype=np.float32)
+        self.std = np.ones(features.shape[1], dtype=np.float32)
+        self.mean[:3] = features[:, :3].mean(axis=0)
+        self.std[:3] = features[:, :3].std(axis=0) + 1e-6
+        x = (features - self.mean) / self.std
+        sample_weights = np.where(labels == 1, 0.5 / labels.mean(), 0.5 / (1 - labels.mean())) / len(labels)
+
+        # Full batch gradient descent of the weighted log loss
+        self.weights = np.zeros(x.shape[1], dtype=np.float32)
+        self.bias = 0.0
+        for _ in range(epochs):
+            errors = (self._sigmoid(x @ self.weights + self.bias) - labels) * sample_weights
+            self.weights -= learning_rate * (x.T @ errors + l2 * self.weights)
+            self.bias -= learning_rate * errors.sum()
+
+        print(f"Section gate trained on {len(labels)} sections ({int(labels.sum())} tagged)")
+        return self
+
+    @staticmethod
+    def _sigmoid(z):
+        return 1 / (1 + np.exp(-np.clip(z, -30, 30)))
+
+    def predict_proba(self, texts: List[str], vectors=None) -> np.ndarray:
+        """
+        Probability of every text to get a tag.
+
+        Parameters:
+        - texts (List[str]): Section answers.
+        - vectors: Embeddings of the texts, computed when None.
+
+        Returns:
+        - np.ndarray: One probability per text.
+        """
+        if self.weights is None:
+            raise ValueError("SectionGate is not trained, call fit or load first")
+        if not texts:
+            return np.zeros(0, dtype=np.float32)
+        vectors = self.embed(texts) if vectors is None else vectors
+        x = (self.features(texts, vectors) - self.mean) / self.std
+        return self._sigmoid(x @ self.weights + self.bias)
+
+    def keep(self, texts: List[str], vectors=None) -> np.ndarray:
+        """
+        Boolean mask of the texts to send to the language model.
+        """
+        return self.predict_proba(texts, vectors) >= self.threshold
+
+    def record(self, sections: int, gated: int, tokens_saved: int):
+        with self._lock:
+            self.sections += sections
+            self.gated += gated
+            self.estimated_tokens_saved += tokens_saved
+
+    def stats(self) -> dict:
+        return {'sections': self.sections, 'gated': self.gated, 'threshold': self.threshold,
+                'estimated_tokens_saved': self.estimated_tokens_saved}
+
+    def save(self, path: str):
+        np.savez(path, weights=self.weights, bias=self.bias, mean=self.mean, std=self.std,
+                 threshold=self.threshold, k=self.k, hash_size=self.hash_size, min_overlap=self.min_overlap)
+
+    @classmethod
+    def load(cls, path: str, quote_vector_store, quote_tag_map: Dict[str, str], threshold: Optional[float] = None) -> 'SectionGate':
+        """
+        Loads a gate saved by save, optionally with another threshold.
+        """
+        saved = np.load(path)
+        gate = cls(quote_vector_store, quote_tag_map,
+                   threshold=float(saved['threshold']) if threshold is None else threshold,
+                   k=int(saved['k']), hash_size=int(saved['hash_size']), min_overlap=float(saved['min_overlap']))
+        gate.weights, gate.bias, gate.mean, gate.std = saved['weights'], float(saved['bias']), saved['mean'], saved['std']
+        return gate
+
+
+def tune_threshold(gate: SectionGate, transcripts: Dict[str, List[TranscriptSection]], highlights: pd.DataFrame,
+                   thresholds: Iterable[float] = (0.05, 0.1, 0.2, 0.3, 0.4, 0.5), predictions: Optional[pd.DataFrame] = None,
+                   max_recall_loss: float = 0.02, n: int = 3, min_overlap: float = 0.5) -> Tuple[float, pd.DataFrame]:
+    """
+    Measures the effect of gate thresholds on transcripts with expert highlights, without any LLM call.
+
+    For every threshold, reports the share of sections skipped and of highlights contained only in
+    skipped sections. With predictions (the output of an ungated run on the same transcripts), also
+    re-scores them without the quotes of the skipped sections, giving the actual recall loss, relative
+    to the recall of the ungated predictions.
+
+    The threshold picked is the highest one such that it and every lower threshold keep both the
+    share of highlights lost and the relative recall loss within max_recall_loss.
+
+    Parameters:
+    - gate (SectionGate): Trained gate.
+    - transcripts (Dict[str, List[TranscriptSection]]): Evaluation transcripts (not used for training).
+    - highlights (DataFrame): Condens export.
+    - thresholds (Iterable[float]): Thresholds to try.
+    - predictions (DataFrame): Optional ungated tagging output of the transcripts.
+    - max_recall_loss (float): Highest share of highlights lost and relative recall loss accepted when picking the threshold.
+    - n (int), min_overlap (float): Alignment settings, as in evaluation.evaluate.
+
+    Returns:
+    - Tuple: Threshold picked (0, no gating, if the lowest one exceeds the bound), and a DataFrame of Threshold,
+      Skipped Sections, Highlights Lost and, with predictions, Recall, F1 and Recall Loss columns.
+    """
+    sections = [(participant, section) for participant, transcript in transcripts.items() for section in transcript]
+    texts = [section.a for _, section in sections]
+    probabilities = gate.predict_proba(texts)
+
+    index = evaluation.HighlightIndex(highlights, n)
+    evaluated = {evaluation.participant_id(participant) for participant in transcripts}
+    contained = [index.match(participant, text, min_overlap) for (participant, _), text in zip(sections, texts)]
+    covered = {row for rows in contained for row in rows}
+    total_highlights = sum(participant in evaluated for participant in index.participants)
+
+    if predictions is not None:
+        predictions = predictions.reset_index(drop=True)
+        matches = evaluation.align(predictions, index, min_overlap)
+        baseline = evaluation.score(predictions, index, matches, participants=transcripts).iloc[-1]
+        # Highest probability of the sections of the participant containing every predicted quote
+        section_texts = {}
+        for (participant, _), text, probability in zip(sections, texts, probabilities):
+            section_texts.setdefault(participant, []).append((" ".join(evaluation.words(text)), probability))
+        prediction_probability = []
+        for quote, participant in zip(predictions['Quote'], predictions['Participant']):
+            quote = " ".join(evaluation.words(quote))
+            containing = [probability for text, probability in section_texts.get(participant, []) if quote in text]
+            prediction_probability.append(max(containing) if containing else 1.0)
+        prediction_probability = np.asarray(prediction_probability)
+
+    rows, best, within_bound = [], 0.0, True
+    for threshold in sorted(thresholds):
+        kept = probabilities >= threshold
+        kept_highlights = {row for section_rows, keep in zip(contained, kept) if keep for row in section_rows}
+        row = {'Threshold': threshold,
+               'Skipped Sections': 1 - kept.mean() if len(kept) else 0.0,
+               'Highlights Lost': len(covered - kept_highlights) / total_highlights if total_highlights else 0.0}
+        losses = [row['Highlights Lost']]
+        if predictions is not None:
+            mask = prediction_probability >= threshold
+            gated = evaluation.score(predictions[mask], index, [m for m, keep in zip(matches, mask) if keep],
+                                     participants=transcripts).iloc[-1]
+            recall_loss = (baseline['Recall'] - gated['Recall']) / baseline['Recall'] if baseline['Recall'] else 0.0
+            row.update({'Recall': gated['Recall'], 'F1': gated['F1'], 'Recall Loss': recall_loss})
+            losses.append(recall_loss)
+        rows.append(row)
+        # Skipping is monotonic in the threshold, stop at the first threshold over the bound
+        within_bound = within_bound and max(losses) <= max_recall_loss
+        if within_bound:
+            best = threshold
+    return best, pd.DataFrame(rows)
+
+
+def main():
+    import tag_cli
+    from example_index import load_example_index
+    from transcript_loader import load_transcripts
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--config', required=True, help="tag_cli.py config (embeddings and example index)")
+    parser.add_argument('--train', required=True, help="Folder of the training transcripts")
+    parser.add_argument('--test', required=True, help="Folder of the evaluation transcripts")
+    parser.add_argument('--highlights', default=evaluation.HIGHLIGHTS_PATH)
+    parser.add_argument('--predictions', default=None, help="Ungated tagging output of the evaluation transcripts")
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[0.05, 0.1, 0.2, 0.3, 0.4, 0.5])
+    parser.add_argument('--max-recall-loss', type=float, default=0.02)
+    parser.add_argument('--save', default=None, help="File the trained gate is saved to, with the chosen threshold")
+    args = parser.parse_args()
+
+    config = tag_cli.load_config(args.config)
+    quote_tag_map, quote_vector_store, _ = load_example_index(config['index_dir'], tag_cli.build_embeddings(config),
+                                                              config['embeddings'].get('model_id'))
+    gate = SectionGate(quote_vector_store, quote_tag_map).fit(load_transcripts(args.train))
+
+    predictions = pd.read_csv(args.predictions) if args.predictions else None
+    threshold, sweep = tune_threshold(gate, load_transcripts(args.test), evaluation.load_highlights(args.highlights),
+                                      args.thresholds, predictions, args.max_recall_loss)
+    print(sweep.round(3).to_string(index=False))
+    print(f"Threshold within {args.max_recall_loss:.1%} of highlights lost and relative recall loss: {threshold}")
+
+    if args.save:
+        gate.threshold = threshold
+        gate.save(args.save)
+
+
+if __name__ == "__main__":
+    main()
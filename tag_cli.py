@@ -0,0 +1,327 @@
+"""
+Command line tagging of a folder of transcripts, without the notebook.
+
+The tagger is built from a JSON config and the example index saved by example_index.py.
+Transcripts are shared between worker processes through a work queue; every worker builds its own
+tagger once, then tags one transcript at a time and writes it to its own shard CSV. The shards are
+merged into a single CSV with the columns of output.csv (Quote, Tag, Confidence, Tag Group, Participant).
+A transcript whose shard exists is not tagged again, so an interrupted job resumes where it stopped.
+
+Example config:
+    {
+        "index_dir": "index/",
+        "llm": {"provider": "bedrock", "model_id": "anthropic.claude-3-5-sonnet-20240620-v1:0", "region_name": "us-east-1"},
+        "embeddings": {"provider": "bedrock", "model_id": "amazon.titan-embed-text-v2:0"},
+        "tagger": {"threshold": 0.7, "k": 5, "max_concurrency": 4},
+        "cache": {"path": "llm_cache.sqlite"},
+        "rate_limiter": {"requests_per_minute": 200, "tokens_per_minute": 400000},
+        "section_gate": {"path": "section_gate.npz"}
+    }
+
+The "cache", "rate_limiter" and "section_gate" entries are optional. The quotas of "rate_limiter"
+are for the whole job and are split evenly between the workers; with a rate limiter the Bedrock
+client does not retry by itself. The section gate is trained and saved by section_gate.py, its
+"threshold" can be overridden in the config. The "fake" provider uses the offline models of
+fake_models.py.
+
+Usage:
+    python tag_cli.py index --config tagger_config.json --highlights "data/Raw Condens Data - highlights_export.csv" --train data/transcripts_train
+    python tag_cli.py tag --config tagger_config.json --input data/transcripts_test --output output.csv --workers 8
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from typing import List, Optional
+
+import pandas as pd
+from tqdm import tqdm
+
+from evaluation import participant_id
+from example_index import build_example_index, load_example_index
+from instrumentation import Instrumentation
+from llm_cache import LLMResponseCache
+from rate_limiter import AdaptiveRateLimiter
+from section_gate import SectionGate
+from tag_definitions import tags
+from transcript_loader import load_transcript
+from transcript_tagger import TranscriptTagger
+
+
+OUTPUT_COLUMNS = ['Quote', 'Tag', 'Confidence', 'Tag Group', 'Participant']
+# Seconds between checks that the workers are still alive while waiting for results
+WORKER_POLL_SECONDS = 5
+
+
+def load_config(path: str) -> dict:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def build_embeddings(config: dict):
+    embeddings_config = dict(config['embeddings'])
+    provider = embeddings_config.pop('provider', 'bedrock')
+    if provider == 'fake':
+        from fake_models import FakeEmbeddings
+        return FakeEmbeddings(**embeddings_config)
+
+    from botocore.config import Config
+    from langchain_aws import BedrockEmbeddings
+    return BedrockEmbeddings(config=Config(retries={'max_attempts': 100}, read_timeout=1000), **embeddings_config)
+
+
+def build_llm(config: dict, quote_tag_map: dict):
+    llm_config = dict(config['llm'])
+    provider = llm_config.pop('provider', 'bedrock')
+    if provider == 'fake':
+        from fake_models import FakeChatModel
+        return FakeChatModel(sorted(set(tag.lower() for tag in quote_tag_map.values())), **llm_config)
+
+    from botocore.config import Config
+    from langchain_aws import ChatBedrock
+    if config.get('rate_limiter'):
+        # Throttles must reach the rate limiter, which does the backoff and retries itself
+        return ChatBedrock(config=Config(retries={'max_attempts': 1}, read_timeout=1000), **llm_config)
+    return ChatBedrock(config=Config(retries={'max_attempts': 100}, read_timeout=1000), **llm_config).with_retry()
+
+
+def build_tagger(config: dict, workers: int = 1, instrumentation: Optional[Instrumentation] = None) -> TranscriptTagger:
+    """
+    Builds a TranscriptTagger from a config and its saved example index, without embedding any training quote.
+
+    Parameters:
+    - config (dict): Parsed JSON config (see the module docstring).
+    - workers (int): Number of processes sharing the rate limiter quotas of the config.
+    - instrumentation (Instrumentation): Optional collector of the tagger timings and counters.
+
+    Returns:
+    - TranscriptTagger: The configured tagger.
+    """
+    embeddings = build_embeddings(config)
+    quote_tag_map, quote_vector_store, tag_vector_store = load_example_index(
+        config['index_dir'], embeddings, config['embeddings'].get('model_id'))
+    llm_instance = build_llm(config, quote_tag_map)
+
+    cache = LLMResponseCache(**config['cache']) if config.get('cache') else None
+
+    rate_limiter = None
+    if config.get('rate_limiter'):
+        limiter_config = dict(config['rate_limiter'])
+        for quota in ('requests_per_minute', 'tokens_per_minute'):
+            if limiter_config.get(quota):
+                limiter_config[quota] = limiter_config[quota] / workers
+        rate_limiter = AdaptiveRateLimiter(**limiter_config)
+
+    section_gate = None
+    if config.get('section_gate'):
+        section_gate = SectionGate.load(config['section_gate']['path'], quote_vector_store, quote_tag_map,
+                                        config['section_gate'].get('threshold'))
+
+    return TranscriptTagger(tags, llm_instance, quote_tag_map, quote_vector_store, tag_vector_store,
+                            cache=cache, rate_limiter=rate_limiter, instrumentation=instrumentation,
+                            section_gate=section_gate, **config.get('tagger', {}))
+
+
+def transcript_participants(folder_path: str) -> List[str]:
+    # Participant names of the transcripts of a folder, in the order of load_transcripts
+    return [os.path.splitext(file_name)[0] for file_name in os.listdir(folder_path) if file_name.endswith('.docx')]
+
+
+def training_highlights(highlights: pd.DataFrame, participants: List[str]) -> pd.DataFrame:
+    """
+    Highlights of the given participants only, like df_train in the notebook, so the example index
+    never holds the expert highlights of the transcripts being tagged or evaluated.
+
+    Participants are compared on their id ("P3" of "P3 Lia O"). The substring test of the notebook
+    would also keep the highlights of P3 when P13 is a training participant.
+    """
+    ids = {participant_id(participant) for participant in participants}
+    return highlights[highlights['Participants'].map(lambda participant: participant_id(participant) in ids)]
+
+
+def shard_path(shard_dir: str, participant: str) -> str:
+    return os.path.join(shard_dir, f"{participant}.csv")
+
+
+def _worker(config: dict, workers: int, shard_dir: str, cache_dir: Optional[str], fast_parser: bool,
+            work_queue, result_queue):
+    # Every worker builds its own tagger, the LLM clients and FAISS indexes are not shared between processes
+    instrumentation = Instrumentation()
+    worker_error = None
+    try:
+        tagger = build_tagger(config, workers, instrumentation)
+
+        for file_path in iter(work_queue.get, None):
+            participant = os.path.splitext(os.path.basename(file_path))[0]
+            failed_before = len(tagger.failed_sections)
+            try:
+                transcript = load_transcript(file_path, cache_dir, fast_parser)
+                df = tagger.tag_transcripts({participant: transcript}).reindex(columns=OUTPUT_COLUMNS)
+            except Exception as e:
+                result_queue.put({'participant': participant, 'error': f"{type(e).__name__}: {e}"})
+                continue
+
+            failed = len(tagger.failed_sections) - failed_before
+            # Transcripts with failed sections get no shard and are tagged again on the next run
+            # (the sections already answered come from the cache, when one is configured)
+            if not failed:
+                tmp_path = shard_path(shard_dir, participant) + ".tmp"
+                df.to_csv(tmp_path, index=False)
+                os.replace(tmp_path, shard_path(shard_dir, participant))
+            result_queue.put({'participant': participant, 'sections': len(transcript), 'rows': len(df), 'failed_sections': failed})
+    except Exception as e:
+        worker_error = f"{type(e).__name__}: {e}"
+    finally:
+        # The parent waits for one done message per worker, it must be sent whatever happens
+        result_queue.put({'done': True, 'pid': os.getpid(), 'error': worker_error,
+                          'counters': instrumentation.report()['counters']})
+
+
+def merge_shards(shard_dir: str, participants, output_path: str) -> pd.DataFrame:
+    """
+    Concatenates the shards of the participants, in the given order, into output_path.
+    """
+    frames = [pd.read_csv(shard_path(shard_dir, participant))
+              for participant in participants if os.path.exists(shard_path(shard_dir, participant))]
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=OUTPUT_COLUMNS)
+    df.to_csv(output_path, index=False)
+    return df
+
+
+def tag_folder(config: dict, input_folder: str, output_path: str, workers: int = 1, shard_dir: Optional[str] = None,
+               cache_dir: Optional[str] = None, fast_parser: bool = False) -> dict:
+    """
+    Tags all transcripts of a folder with worker processes and merges their shards into output_path.
+
+    Parameters:
+    - config (dict): Parsed JSON config of the tagger.
+    - input_folder (str): Folder of .docx transcripts.
+    - output_path (str): CSV file of the merged tags.
+    - workers (int): Number of worker processes.
+    - shard_dir (str): Folder of the per-transcript shards, defaults to output_path + ".shards".
+    - cache_dir (str): Optional cache folder of the parsed transcripts (see load_transcript).
+    - fast_parser (bool): Parse the transcripts with process_transcript_fast.
+
+    Returns:
+    - dict: Run summary (transcripts tagged, skipped and failed, rows, failed sections, worker errors and counters).
+    """
+    shard_dir = shard_dir or output_path + ".shards"
+    os.makedirs(shard_dir, exist_ok=True)
+
+    # Same order as load_transcripts
+    participants = transcript_participants(input_folder)
+    file_paths = [os.path.join(input_folder, participant + '.docx') for participant in participants]
+    pending = [file_path for file_path, participant in zip(file_paths, participants)
+               if not os.path.exists(shard_path(shard_dir, participant))]
+    workers = max(1, min(workers, len(pending)))
+
+    summary = {'transcripts': len(file_paths), 'skipped': len(file_paths) - len(pending), 'tagged': 0,
+               'failed': [], 'sections': 0, 'failed_sections': 0, 'worker_errors': [], 'counters': {}}
+    start = time.perf_counter()
+
+    if pending:
+        context = multiprocessing.get_context('spawn')
+        work_queue, result_queue = context.Queue(), context.Queue()
+        for file_path in pending:
+            work_queue.put(file_path)
+        for _ in range(workers):
+            work_queue.put(None)
+
+        processes = [context.Process(target=_worker, args=(config, workers, shard_dir, cache_dir, fast_parser, work_queue, result_queue))
+                     for _ in range(workers)]
+        for process in processes:
+            process.start()
+
+        finished, reported = set(), set()
+        with tqdm(total=len(pending), desc="Tagging transcripts") as progress:
+            while len(finished) < len(processes):
+                try:
+                    result = result_queue.get(timeout=WORKER_POLL_SECONDS)
+                except queue.Empty:
+                    # A worker killed by a crash or out of memory never sends its done message
+                    for process in processes:
+                        if process.pid not in finished and not process.is_alive():
+                            finished.add(process.pid)
+                            summary['worker_errors'].append(f"Worker {process.pid} died with exit code {process.exitcode}")
+                            print(summary['worker_errors'][-1])
+                    continue
+                if result.get('done'):
+                    finished.add(result['pid'])
+                    if result['error']:
+                        summary['worker_errors'].append(f"Worker {result['pid']} failed: {result['error']}")
+                        print(summary['worker_errors'][-1])
+                    for name, value in result['counters'].items():
+                        summary['counters'][name] = summary['counters'].get(name, 0) + value
+                    continue
+                progress.update(1)
+                reported.add(result['participant'])
+                if result.get('error') or result['failed_sections']:
+                    summary['failed'].append(result['participant'])
+                    print(f"{result['participant']}: {result.get('error') or str(result['failed_sections']) + ' failed sections'}")
+                if not result.get('error'):
+                    summary['tagged'] += 1
+                    summary['sections'] += result['sections']
+                    summary['failed_sections'] += result['failed_sections']
+        for process in processes:
+            process.join()
+
+        # Transcripts never reported were lost with a failed worker
+        summary['failed'].extend(os.path.splitext(os.path.basename(file_path))[0] for file_path in pending
+                                 if os.path.splitext(os.path.basename(file_path))[0] not in reported)
+
+    df = merge_shards(shard_dir, participants, output_path)
+    summary['rows'] = len(df)
+    summary['seconds'] = time.perf_counter() - start
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    index_parser = subparsers.add_parser('index', help="Build or update the example index of the config")
+    index_parser.add_argument('--config', required=True)
+    index_parser.add_argument('--highlights', required=True, help="CSV of tagged quotes with Quote, Participants and Tag columns")
+    index_parser.add_argument('--train', default=None,
+                              help="Folder of the training transcripts, only the highlights of their participants are indexed")
+
+    tag_parser = subparsers.add_parser('tag', help="Tag a folder of transcripts")
+    tag_parser.add_argument('--config', required=True)
+    tag_parser.add_argument('--input', required=True, help="Folder of .docx transcripts")
+    tag_parser.add_argument('--output', default='output.csv')
+    tag_parser.add_argument('--workers', type=int, default=os.cpu_count())
+    tag_parser.add_argument('--shard-dir', default=None)
+    tag_parser.add_argument('--transcript-cache-dir', default=None)
+    tag_parser.add_argument('--fast-parser', action='store_true')
+    tag_parser.add_argument('--report', default=None, help="Optional JSON file the run summary is written to")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+
+    if args.command == 'index':
+        highlights = pd.read_csv(args.highlights)
+        if args.train:
+            highlights = training_highlights(highlights, transcript_participants(args.train))
+        else:
+            print("Indexing the highlights of all participants, do not evaluate on transcripts of these participants")
+        print(f"Indexing {len(highlights)} highlights")
+        quote_tag_map = highlights.set_index('Quote')['Tag'].to_dict()
+        build_example_index(config['index_dir'], quote_tag_map, build_embeddings(config), config['embeddings'].get('model_id'))
+        return
+
+    summary = tag_folder(config, args.input, args.output, args.workers, args.shard_dir,
+                         args.transcript_cache_dir, args.fast_parser)
+    print(f"Tagged {summary['tagged']} transcripts ({summary['skipped']} already done, {len(summary['failed'])} failed), "
+          f"{summary['rows']} rows written to {args.output} in {summary['seconds']:.1f}s")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+    if summary['failed'] or summary['worker_errors']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,13 @@
+import hashlib
 import os
+import pickle
 import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from xml.etree.ElementTree import iterparse
 from docx import Document
 
-from typing import NamedTuple
+from typing import Iterator, List, NamedTuple, Optional, Tuple
 
 
 class TranscriptSection(NamedTuple):
@@ -49,13 +54,166 @@ def process_transcript(file_path):
     
     return qna_list
 
-def load_transcripts(folder_path):
-    transcripts_dict = {}
+# WordprocessingML tags used by the fast parser
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_BODY, _P, _R, _HYPERLINK = _W + 'body', _W + 'p', _W + 'r', _W + 'hyperlink'
+_T, _BR, _BR_TYPE = _W + 't', _W + 'br', _W + 'type'
+# Text equivalent of the other run content elements, as in python-docx Run.text
+_RUN_SYMBOLS = {_W + 'tab': '\t', _W + 'ptab': '\t', _W + 'cr': '\n', _W + 'noBreakHyphen': '-'}
+
+def _is_participant_fast(text):
+    # Same rule as is_participant (P followed by a digit), without a regex
+    return text[:1] == 'P' and text[1:2].isdecimal()
+
+def _paragraph_texts(file_path):
+    """
+    Streams the text of the body paragraphs of a .docx, like python-docx Document(file_path).paragraphs.
+    """
+    with zipfile.ZipFile(file_path) as archive, archive.open('word/document.xml') as document:
+        stack = []
+        parts = []
+        for event, elem in iterparse(document, events=('start', 'end')):
+            if event == 'start':
+                stack.append(elem.tag)
+                continue
+            
+            stack.pop()
+            tag = elem.tag
+            # Run content counts for runs directly in a body paragraph or in one of its hyperlinks
+            # (body > p > r > content or body > p > hyperlink > r > content)
+            if len(stack) >= 3 and stack[-1] == _R and (
+                    (stack[-2] == _P and stack[-3] == _BODY) or
+                    (len(stack) >= 4 and stack[-2] == _HYPERLINK and stack[-3] == _P and stack[-4] == _BODY)):
+                if tag == _T:
+                    parts.append(elem.text or '')
+                elif tag == _BR:
+                    parts.append('\n' if elem.get(_BR_TYPE, 'textWrapping') == 'textWrapping' else '')
+                elif tag in _RUN_SYMBOLS:
+                    parts.append(_RUN_SYMBOLS[tag])
+            elif tag == _P and stack and stack[-1] == _BODY:
+                yield ''.join(parts)
+                parts = []
+                # Drop the parsed paragraph so memory does not grow with the document
+                elem.clear()
+
+def process_transcript_fast(file_path):
+    """
+    Faster equivalent of process_transcript, streaming word/document.xml out of the .docx
+    instead of building the python-docx object model.
+    """
+    qna_list = []
+    current_q = None
+    
+    paragraphs = _paragraph_texts(file_path)
+    # Skip the first paragraph (title), like process_transcript
+    next(paragraphs, None)
+    
+    for text in paragraphs:
+        text = text.strip()
+        
+        if not text or text.startswith("Bookmark:"):
+            continue
+        
+        # Drop the "[speaker timestamp]" prefix
+        _, bracket, tail = text.partition(']')
+        content = tail.strip() if bracket else text
+        
+        if _is_participant_fast(text):
+            qna_list.append(TranscriptSection(q=current_q if current_q is not None else '', a=content))
+            current_q = None
+        else:
+            current_q = content
+    
+    return qna_list
+
+def _file_hash(file_path):
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def load_transcript(file_path, cache_dir: Optional[str] = None, fast_parser: bool = False) -> List[TranscriptSection]:
+    """
+    Parses a transcript, going through the parsed-transcript cache when cache_dir is given.
+    fast_parser uses process_transcript_fast instead of process_transcript.
+
+    A cached transcript is reused when the file mtime and size are unchanged, or else
+    when the content hash is unchanged (e.g. the file was copied or touched).
+    """
+    parse = process_transcript_fast if fast_parser else process_transcript
+    
+    if cache_dir is None:
+        return parse(file_path)
+    
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = os.path.join(cache_dir, hashlib.sha256(os.path.abspath(file_path).encode('utf-8')).hexdigest() + '.pkl')
+    stat = os.stat(file_path)
+    
+    cached = None
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            cached = None
+    
+    if cached is not None and cached['mtime'] == stat.st_mtime and cached['size'] == stat.st_size:
+        return cached['sections']
+    
+    content_hash = _file_hash(file_path)
+    if cached is not None and cached['hash'] == content_hash:
+        sections = cached['sections']
+    else:
+        sections = parse(file_path)
+    
+    # Write to a temporary file first so concurrent loaders never read a partial entry
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump({'mtime': stat.st_mtime, 'size': stat.st_size, 'hash': content_hash, 'sections': sections}, f)
+    os.replace(tmp_path, cache_path)
+    
+    return sections
+
+def _load_participant(file_path, cache_dir, fast_parser):
+    participant = os.path.splitext(os.path.basename(file_path))[0]
+    return participant, load_transcript(file_path, cache_dir, fast_parser)
+
+def _transcript_files(folder_path):
+    return [os.path.join(folder_path, file_name) for file_name in os.listdir(folder_path) if file_name.endswith('.docx')]
+
+def iter_transcripts(folder_path, max_workers: Optional[int] = 1, cache_dir: Optional[str] = None,
+                     fast_parser: bool = False) -> Iterator[Tuple[str, List[TranscriptSection]]]:
+    """
+    Lazily loads the transcripts of a folder, yielding (participant, sections) as each file is parsed.
+
+    Parameters:
+    - folder_path (str): Folder with the .docx transcripts.
+    - max_workers (int): Number of parser processes, 1 parses in this process and None uses all cores.
+      With several processes the transcripts are yielded in completion order.
+    - cache_dir (str): Optional folder of the parsed-transcript cache.
+    - fast_parser (bool): Parse with process_transcript_fast.
+    """
+    file_paths = _transcript_files(folder_path)
+    
+    if max_workers == 1 or len(file_paths) <= 1:
+        for file_path in file_paths:
+            yield _load_participant(file_path, cache_dir, fast_parser)
+        return
+    
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_load_participant, file_path, cache_dir, fast_parser) for file_path in file_paths]
+        for future in as_completed(futures):
+            yield future.result()
+
+def load_transcripts(folder_path, max_workers: Optional[int] = 1, cache_dir: Optional[str] = None, fast_parser: bool = False):
+    """
+    Loads all transcripts of a folder into a dictionary of participant name to sections,
+    in folder listing order. See iter_transcripts for the parameters.
+    """
+    transcripts = dict(iter_transcripts(folder_path, max_workers, cache_dir, fast_parser))
     
-    for file_name in os.listdir(folder_path):
-        if file_name.endswith('.docx'):
-            file_path = os.path.join(folder_path, file_name)
-            qna_list = process_transcript(file_path)
-            transcripts_dict[os.path.splitext(file_name)[0]] = qna_list
+    order = [os.path.splitext(os.path.basename(file_path))[0] for file_path in _transcript_files(folder_path)]
+    transcripts_dict = {participant: transcripts[participant] for participant in order}
     
     return transcripts_dict
@@ -1,7 +1,19 @@
+import asyncio
+import os
+import threading
+import faiss
+import numpy as np
 import pandas as pd
-from typing import List, Dict
-from collections import namedtuple
+from typing import List, Dict, Optional, Iterable, Iterator, Tuple, Union
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from tag_definitions import Tag
+from llm_cache import LLMResponseCache, CacheMissError, model_id_of
+from checkpoint import TaggingCheckpoint
+from rate_limiter import AdaptiveRateLimiter
+from instrumentation import NULL_INSTRUMENTATION
+from response_parser import ResponseParser
+from chunking import estimate_tokens, chunk_spans, merge_quotes
 from transcript_loader import TranscriptSection
 from tqdm import tqdm  # Import tqdm for progress bars
 
@@ -10,7 +22,10 @@ QuoteTagExample = namedtuple('QuoteTagExample', ['quote', 'tag'])
 
 
 
-QUOTE_TAGGING_PROMPT = """
+# The prompt is split in a static prefix, identical for every section of a tagger, and a
+# per-section suffix. The prefix is rendered once per TranscriptTagger and can be sent as a
+# provider prompt-cache block.
+QUOTE_TAGGING_PROMPT_PREFIX = """
 
 Context:
 You are a User Experience Research tagging assistant, helping Grubhub identify valuable insights from user quotes during interviews.
@@ -19,7 +34,7 @@ Instructions:
 
 You will be given an input text formatted as follows:
 <input_text>
-{quote_text}
+The interview answer to tag
 </input_text>
 
 Your task is to identify relevant quotes and tag them accordingly. Provide your output in JSON format using the structure below:
@@ -46,12 +61,6 @@ Below are instructions on when certain tags should be applied. You can use these
 <tag_instructions>
 
 
-A few examples of quotes that have been manually tagged by experts:
-
-<examples>
-{few_shot_examples}
-</examples>
-
 The <input_text> may contain multiple quotes, and not all of it must be tagged. Focus on tagging parts that provide valuable insights for supporting user study analysis.
 
 
@@ -86,6 +95,14 @@ The expected output would look more like this:
 }}
 ]
 
+"""
+
+QUOTE_TAGGING_PROMPT_SUFFIX = """
+A few examples of quotes that have been manually tagged by experts:
+
+<examples>
+{few_shot_examples}
+</examples>
 
 
 Your turn.
@@ -98,9 +115,57 @@ Only return the JSON output for the tag.
                 
 """
 
+QUOTE_TAGGING_PROMPT = QUOTE_TAGGING_PROMPT_PREFIX + QUOTE_TAGGING_PROMPT_SUFFIX
+
+# Suffix used in batching mode, where several consecutive sections are tagged with a single call
+BATCH_TAGGING_PROMPT_SUFFIX = """
+A few examples of quotes that have been manually tagged by experts:
+
+<examples>
+{few_shot_examples}
+</examples>
+
+
+Your turn.
+This time the input contains several sections of the interview, each one in its own <input_text id="..."> block.
+Tag every section independently, a quote can only contain text from a single section.
+Add a 'section' field with the id of the section the quote comes from to every item of the output.
+Only return a single JSON array with the output for all the sections.
+
+
+{sections}
+                
+"""
+
+
+# Follow-up sent when a response could not be parsed
+REASK_PROMPT = """
+Your previous answer could not be parsed:
+<previous_answer>
+{response}
+</previous_answer>
+
+Only return the JSON array, with no other text.
+"""
+
+# Columns of the tagged rows of a section, before post-processing
+RECORD_COLUMNS = ['Quote', 'Tag', 'Confidence']
+
+# Maximum number of few-shot examples in a prompt
+MAX_FEW_SHOT_EXAMPLES = 20
+# Extra neighbours fetched by _vector_search and decimals of the distances it ranks them on
+VECTOR_SEARCH_MARGIN = 10
+VECTOR_SEARCH_DECIMALS = 4
+
 
 class TranscriptTagger:
-    def __init__(self, tags: List[Tag], llm_instance, quote_tag_map, quote_vector_store, tag_vector_store, threshold: float = 0.7, k: int = 5):
+    def __init__(self, tags: List[Tag], llm_instance, quote_tag_map, quote_vector_store, tag_vector_store, threshold: float = 0.7, k: int = 5, max_concurrency: int = 1,
+                 cache: Optional[LLMResponseCache] = None, prompt_caching: bool = False,
+                 batch_token_budget: Optional[int] = None, batch_retrieval: bool = True,
+                 rate_limiter: Optional[AdaptiveRateLimiter] = None, instrumentation=None,
+                 example_token_budget: Optional[int] = None, mmr_lambda: float = 0.7,
+                 reask_on_parse_failure: bool = False, max_section_tokens: Optional[int] = None,
+                 chunk_overlap_tokens: int = 50, section_gate=None, gated_tagger: Optional['TranscriptTagger'] = None):
         """
         Initialize the TranscriptTagger class.
 
@@ -110,6 +175,24 @@ class TranscriptTagger:
         - quote_vector_store: Pre-trained FAISS vector store with example quotes and their tags.
         - tag_vector_store: Pre-trained FAISS vector store with tag information.
         - threshold (float): Minimum confidence required to assign a tag.
+        - max_concurrency (int): Maximum number of sections tagged at the same time (1 runs sequentially).
+        - cache (LLMResponseCache): Optional on-disk cache of LLM responses keyed by model id and prompt.
+        - prompt_caching (bool): Send the static prompt prefix as a provider prompt-cache block (chat messages instead of a plain string).
+        - batch_token_budget (int): When set, consecutive sections are packed into a single prompt up to this many answer tokens.
+        - batch_retrieval (bool): Embed and search the examples of all sections at once instead of one section at a time.
+        - rate_limiter (AdaptiveRateLimiter): Optional scheduler of the LLM calls (request and token quotas, backoff on throttles).
+        - instrumentation (Instrumentation): Optional collector of per-stage timings and counters, disabled by default.
+        - example_token_budget (int): When set, few-shot examples are picked by MMR (relevance to the section
+          and diversity) until this many tokens are used.
+        - mmr_lambda (float): Weight of relevance against diversity in the MMR selection (1 ignores diversity).
+        - reask_on_parse_failure (bool): Ask the model once more when its response contains no JSON array.
+        - max_section_tokens (int): When set, longer answers are split at sentence boundaries into windows
+          of at most this many tokens, tagged in parallel and merged back.
+        - chunk_overlap_tokens (int): Tokens of overlap between consecutive windows.
+        - section_gate (SectionGate): Optional local classifier of the sections worth a language model call,
+          the other sections get no tag (see section_gate.py).
+        - gated_tagger (TranscriptTagger): Optional tagger (e.g. with a cheaper model) of the sections
+          rejected by section_gate, instead of skipping them.
         """
         self.tags = tags
         self.llm_instance = llm_instance
@@ -118,7 +201,39 @@ class TranscriptTagger:
         self.tag_vector_store = tag_vector_store
         self.threshold = threshold
         self.k = k
+        self.max_concurrency = max_concurrency
+        self.cache = cache
+        self.model_id = model_id_of(llm_instance)
+        self.prompt_caching = prompt_caching
+        self.batch_token_budget = batch_token_budget
+        self.batch_retrieval = batch_retrieval
+        self.rate_limiter = rate_limiter
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION
+        self.example_token_budget = example_token_budget
+        self.mmr_lambda = mmr_lambda
+        self.reask_on_parse_failure = reask_on_parse_failure
+        self.max_section_tokens = max_section_tokens
+        self.chunk_overlap_tokens = chunk_overlap_tokens
+        self.section_gate = section_gate
+        self.gated_tagger = gated_tagger
+        
+        # Formatted example and example quotes of every tag, built on first use
+        self._formatted_examples = {}
+        self._tag_examples = {}
+        # FAISS row of every quote in quote_vector_store, built on first MMR selection
+        self._quote_rows = None
         
+        # Neighbours of every tag in tag_vector_store, computed on first use
+        self._related_tags = None
+        self._related_tags_lock = threading.Lock()
+        
+        # Sections that raised while being tagged, as (section, exception) pairs
+        self.failed_sections = []
+        
+        
+        # Case-normalised tag -> Tag Group index, used in a single vectorized map during post-processing.
+        # Tag names repeated across groups keep the last group, as add_tag_group always did.
+        self.tag_groups = {tag.tag.lower(): tag.tag_group for tag in self.tags}
         
         # TODO: check this .lower() here if necessary in the future
         # tag_quote_map
@@ -128,6 +243,13 @@ class TranscriptTagger:
                 tag_quote_map[tag.lower()] = []  # Initialize an empty list for new tags
             tag_quote_map[tag.lower()].append(quote)  # Add the quote to the appropriate tag
         self.tag_quote_map = tag_quote_map
+        
+        # Responses are validated against the tags offered in the prompt
+        self.response_parser = ResponseParser(self.tag_quote_map.keys())
+        
+        # The tags and their instructions do not change during the life of the tagger,
+        # so the static part of the prompt is rendered only once
+        self.prompt_prefix = self.render_prompt_prefix()
 
     def tag_instructions(self):
         tag_instructions = []
@@ -142,30 +264,62 @@ class TranscriptTagger:
         
         return tag_instructions
     
-    def construct_prompt(self, quote: str, examples: List[QuoteTagExample]) -> str:
+    def render_prompt_prefix(self) -> str:
+        """
+        Renders the static prompt prefix (eligible tags, tag instructions and fixed examples).
+        """
+        eligible_tags = "<tag_separator>".join(list(self.tag_quote_map.keys()))
+        
+        if not eligible_tags:
+            eligible_tags = "no_tags_are_available"
         
+        return QUOTE_TAGGING_PROMPT_PREFIX.format(eligible_tags=eligible_tags,
+                                                  tag_instructions=self.tag_instructions())
+    
+    def construct_prompt(self, quote: str, examples: List[QuoteTagExample]):
+        """
+        Builds the prompt for a section on top of the pre-rendered prefix.
+
+        Returns:
+        - str: The full prompt, or a list with one chat message whose prefix block is marked
+          for provider prompt caching when prompt_caching is enabled.
+        """
         if examples:
             few_shot_examples = ", ".join([self.format_example(example) for example in examples])
             few_shot_examples = "["+ few_shot_examples + "]"
         else:
             few_shot_examples = "We do not have relevant examples."
         
-        eligible_tags = "<tag_separator>".join(list(self.tag_quote_map.keys()))
+        suffix = QUOTE_TAGGING_PROMPT_SUFFIX.format(quote_text=quote if quote else "",
+                                                    few_shot_examples=few_shot_examples)
         
-        if not eligible_tags:
-            eligible_tags = "no_tags_are_available"
+        return self._assemble_prompt(suffix)
+    
+    def construct_batch_prompt(self, quotes: List[str], examples: List[QuoteTagExample]):
+        """
+        Builds a single prompt for several sections, identified by their position (1, 2, ...) in quotes.
+        """
+        if examples:
+            few_shot_examples = ", ".join([self.format_example(example) for example in examples])
+            few_shot_examples = "["+ few_shot_examples + "]"
+        else:
+            few_shot_examples = "We do not have relevant examples."
         
-        try:
-            prompt = QUOTE_TAGGING_PROMPT.format(quote_text=quote if quote else "",
-                                                 eligible_tags=eligible_tags,
-                                                 tag_instructions=self.tag_instructions(),
-                                                 few_shot_examples=few_shot_examples
-                                                )
-        except Exception as e:
-            print(few_shot_examples)
-            raise e
-
-        return prompt
+        sections = "\n\n".join(f'<input_text id="{i}">\n{quote if quote else ""}\n</input_text>'
+                                for i, quote in enumerate(quotes, start=1))
+        
+        suffix = BATCH_TAGGING_PROMPT_SUFFIX.format(sections=sections,
+                                                    few_shot_examples=few_shot_examples)
+        
+        return self._assemble_prompt(suffix)
+    
+    def _assemble_prompt(self, suffix: str):
+        if not self.prompt_caching:
+            return self.prompt_prefix + suffix
+        
+        return [{"role": "user",
+                 "content": [{"type": "text", "text": self.prompt_prefix, "cache_control": {"type": "ephemeral"}},
+                             {"type": "text", "text": suffix}]}]
 
     def process_llm_response(self, response) -> pd.DataFrame:
         """
@@ -175,103 +329,719 @@ class TranscriptTagger:
         - response (str): JSON string response from the language model.
 
         Returns:
-        - pd.DataFrame: DataFrame containing Quote, Tag, and Confidence columns.
+        - pd.DataFrame: DataFrame containing quote, tag, and confidence columns (empty if the response cannot be parsed).
         """
-        
-        # Ensure response is always a valid JSON, either a list of tags or an empty list.
-        if not response or response == "[]":
-            return pd.DataFrame(columns=['quote', 'tag', 'confidence'])
-        
-        try:
-            responses = pd.read_json(response)
-            return responses
-        except ValueError:
-            # If the response is not a valid JSON, return an empty DataFrame
-            return pd.DataFrame(columns=['quote', 'tag', 'confidence'])
+        records = self.response_parser.parse(response) or []
+        return self.records_frame(records).rename(columns=str.lower)
+    
+    @staticmethod
+    def records_frame(records: List[dict]) -> pd.DataFrame:
+        """
+        DataFrame of parsed records, with the Quote, Tag and Confidence columns even when empty.
+        """
+        return pd.DataFrame.from_records(records, columns=RECORD_COLUMNS)
+    
+    def _reask_prompt(self, prompt, response: str):
+        reask = REASK_PROMPT.format(response=response)
+        if isinstance(prompt, str):
+            return prompt + reask
+        return prompt + [{"role": "assistant", "content": response}, {"role": "user", "content": reask}]
+    
+    def _parse(self, response: str) -> Optional[List[dict]]:
+        with self.instrumentation.stage('parse'):
+            records = self.response_parser.parse(response)
+        if records is None:
+            self.instrumentation.count('parse_failures')
+        return records
+    
+    def section_records(self, prompt, response: str) -> List[dict]:
+        """
+        Parses the response to a prompt into records, asking the model once more
+        if it cannot be parsed and reask_on_parse_failure is set.
+        """
+        records = self._parse(response)
+        if records is None and self.reask_on_parse_failure:
+            self.instrumentation.count('reasks')
+            records = self._parse(self.query_language_model(self._reask_prompt(prompt, response)))
+        return records or []
+    
+    async def asection_records(self, prompt, response: str) -> List[dict]:
+        """
+        Async version of section_records.
+        """
+        records = self._parse(response)
+        if records is None and self.reask_on_parse_failure:
+            self.instrumentation.count('reasks')
+            records = self._parse(await self.aquery_language_model(self._reask_prompt(prompt, response)))
+        return records or []
 
     
-    def query_language_model(self, prompt: str) -> pd.DataFrame:
-        return self.llm_instance.invoke(prompt).content.strip()
+    def _cached_response(self, prompt: str) -> Optional[str]:
+        if self.cache is None:
+            return None
+        response = self.cache.get(self.model_id, prompt)
+        self.instrumentation.count('cache_hits' if response is not None else 'cache_misses')
+        if response is None and self.cache.read_only:
+            raise CacheMissError(f"Prompt not found in replay cache {self.cache.path}")
+        return response
+    
+    def _store_response(self, prompt: str, response: str):
+        if self.cache is not None:
+            self.cache.set(self.model_id, prompt, response)
+    
+    @staticmethod
+    def prompt_tokens(prompt) -> int:
+        # Estimated input tokens of a plain or chat message prompt
+        if isinstance(prompt, str):
+            return estimate_tokens(prompt)
+        return sum(estimate_tokens(block['text']) for message in prompt for block in message['content'])
+    
+    def _invoke(self, prompt) -> str:
+        if self.rate_limiter is None:
+            return self.llm_instance.invoke(prompt).content.strip()
+        return self.rate_limiter.call(lambda: self.llm_instance.invoke(prompt), self.prompt_tokens(prompt)).content.strip()
+    
+    async def _ainvoke(self, prompt) -> str:
+        if self.rate_limiter is None:
+            return (await self.llm_instance.ainvoke(prompt)).content.strip()
+        return (await self.rate_limiter.acall(lambda: self.llm_instance.ainvoke(prompt), self.prompt_tokens(prompt))).content.strip()
+    
+    def _record_call(self, prompt, response: str):
+        self.instrumentation.count('llm_calls')
+        if self.instrumentation.enabled:
+            self.instrumentation.record('prompt_tokens', self.prompt_tokens(prompt))
+            self.instrumentation.record('response_tokens', estimate_tokens(response))
+    
+    def query_language_model(self, prompt: str) -> str:
+        response = self._cached_response(prompt)
+        if response is None:
+            with self.instrumentation.stage('llm'):
+                response = self._invoke(prompt)
+            self._record_call(prompt, response)
+            self._store_response(prompt, response)
+        return response
+    
+    async def aquery_language_model(self, prompt: str) -> str:
+        # Fall back to a worker thread for LLM instances without native async support
+        if not hasattr(self.llm_instance, 'ainvoke'):
+            return await asyncio.to_thread(self.query_language_model, prompt)
+        response = self._cached_response(prompt)
+        if response is None:
+            with self.instrumentation.stage('llm'):
+                response = await self._ainvoke(prompt)
+            self._record_call(prompt, response)
+            self._store_response(prompt, response)
+        return response
     
     
     def format_example(self, example: QuoteTagExample):
-        return f"""{{"quote": "{example.quote}", "tag":"{example.tag}", "confidence": 1.0}}"""
+        formatted = self._formatted_examples.get(example)
+        if formatted is None:
+            formatted = f"""{{"quote": "{example.quote}", "tag":"{example.tag}", "confidence": 1.0}}"""
+            self._formatted_examples[example] = formatted
+        return formatted
 
     
     def few_shot_examples_from_quote(self, quote) -> List[QuoteTagExample]:
-        retrieved_quotes = self.quote_vector_store.similarity_search(quote, self.k)
+        embeddings = self._store_embeddings(self.quote_vector_store)
+        if embeddings is not None:
+            # Same search as the batched retrieval, so a section gets the same examples either way
+            retrieved_quotes = self._vector_search(self.quote_vector_store, [embeddings.embed_query(quote)], self.k)[0]
+        else:
+            retrieved_quotes = [document.page_content for document in self.quote_vector_store.similarity_search(quote, self.k)]
         
-        few_shot_examples = [QuoteTagExample(quote = quote.page_content, 
-                                             tag = self.quote_tag_map.get(quote.page_content))
-                             for quote in retrieved_quotes
+        few_shot_examples = [QuoteTagExample(quote = retrieved_quote, 
+                                             tag = self.quote_tag_map.get(retrieved_quote))
+                             for retrieved_quote in retrieved_quotes
                             ]
         return few_shot_examples
     
     def few_shot_examples_from_tags(self, tags) -> List[QuoteTagExample]:
         
-        related_tags = set()
+        # Ordered de-duplication (not a set) so the prompt, and its cache key, is the same on every run
+        related_tags = {}
         
         for tag in tags:
-            for related_tag in self.tag_vector_store.similarity_search(tag, self.k):
-                related_tags.add(related_tag.page_content.lower())
+            for related_tag in self.related_tags(tag):
+                related_tags[related_tag] = None
 
         
         # Get quotes associated to the related tags
         
         few_shot_examples = []
         for tag in related_tags:
-            quotes = self.tag_quote_map.get(tag)[:3] # Limit to 5 examples per extra tag
-            if quotes:
-                for quote in quotes:
-                    example = QuoteTagExample(quote = quote,
-                                              tag = tag)
-                    few_shot_examples.append(example)
+            few_shot_examples.extend(self.tag_examples(tag))
             
         return few_shot_examples
+    
+    def tag_examples(self, tag: str) -> List[QuoteTagExample]:
+        """
+        Example quotes of a tag (the same for every section, so built once per tag).
+        """
+        examples = self._tag_examples.get(tag)
+        if examples is None:
+            quotes = self.tag_quote_map.get(tag)[:3] # Limit to 5 examples per extra tag
+            examples = [QuoteTagExample(quote = quote, tag = tag) for quote in quotes]
+            self._tag_examples[tag] = examples
+        return examples
+    
+    def related_tags(self, tag) -> List[str]:
+        """
+        Nearest tags of a tag in tag_vector_store (lower case).
+        
+        The neighbours of the whole tag vocabulary are computed once with a single batched
+        search, other tags are searched one by one and memoized.
+        """
+        with self._related_tags_lock:
+            if self._related_tags is None:
+                self._related_tags = self._compute_related_tags()
+        
+        if tag not in self._related_tags:
+            embeddings = self._store_embeddings(self.tag_vector_store)
+            if embeddings is not None:
+                related_tags = self._vector_search(self.tag_vector_store, [embeddings.embed_query(tag)], self.k)[0]
+            else:
+                related_tags = [document.page_content for document in self.tag_vector_store.similarity_search(tag, self.k)]
+            self._related_tags[tag] = [related_tag.lower() for related_tag in related_tags]
+        return self._related_tags[tag]
+    
+    def _compute_related_tags(self) -> Dict[str, List[str]]:
+        vocabulary = list(dict.fromkeys(tag for tag in self.quote_tag_map.values() if isinstance(tag, str)))
+        embeddings = self._store_embeddings(self.tag_vector_store)
+        if not vocabulary or embeddings is None:
+            return {}
+        neighbours = self._vector_search(self.tag_vector_store, embeddings.embed_documents(vocabulary), self.k)
+        return {tag: [related_tag.lower() for related_tag in related_tags]
+                for tag, related_tags in zip(vocabulary, neighbours)}
+    
+    @staticmethod
+    def _store_embeddings(vector_store):
+        # Embeddings model of a LangChain FAISS store, None if the store cannot be searched in batch
+        embeddings = getattr(vector_store, 'embeddings', None) or getattr(vector_store, 'embedding_function', None)
+        if not hasattr(embeddings, 'embed_documents') or not hasattr(vector_store, 'index'):
+            return None
+        return embeddings
+    
+    @staticmethod
+    def _vector_search(vector_store, vectors, k: int) -> List[List[str]]:
+        """
+        Searches a LangChain FAISS store for many vectors with a single index.search call.
+
+        FAISS computes distances differently depending on the number of queries, so near-ties
+        could come out in another order when the same section is searched in another batch, and
+        change its prompt (and cache key). Candidates are fetched with a margin and re-ranked on
+        rounded distance, then FAISS row, so the result does not depend on the batch.
+        Inner product indexes return similarities, those are ranked highest first.
+
+        Returns:
+        - List[List[str]]: Texts of the k nearest documents of every vector, closest first.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if getattr(vector_store, '_normalize_L2', False):
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1, norms)
+        distances, indices = vector_store.index.search(vectors, k + VECTOR_SEARCH_MARGIN)
+        sign = -1 if getattr(vector_store.index, 'metric_type', faiss.METRIC_L2) == faiss.METRIC_INNER_PRODUCT else 1
         
+        results = []
+        for row_distances, row_indices in zip(distances, indices):
+            candidates = sorted((round(sign * float(distance), VECTOR_SEARCH_DECIMALS), int(i))
+                                for distance, i in zip(row_distances, row_indices) if i != -1)
+            results.append([vector_store.docstore.search(vector_store.index_to_docstore_id[i]).page_content
+                            for _, i in candidates[:k]])
+        return results
     
     def few_shot_examples(self, quote: str) -> List[QuoteTagExample]:
         """
         Get examples
         """
+        embeddings = self._store_embeddings(self.quote_vector_store)
+        if self.example_token_budget is None or embeddings is None:
+            examples = self.few_shot_examples_from_quote(quote)
+            return self._with_related_tag_examples(examples)
         
-        examples = self.few_shot_examples_from_quote(quote)
+        # MMR selection needs the section vector, embed it once and search by vector
+        query_vector = embeddings.embed_query(quote)
+        retrieved_quotes = self._vector_search(self.quote_vector_store, [query_vector], self.k)[0]
+        examples = [QuoteTagExample(quote = retrieved_quote, tag = self.quote_tag_map.get(retrieved_quote))
+                    for retrieved_quote in retrieved_quotes]
+        return self._with_related_tag_examples(examples, query_vector)
+    
+    def _with_related_tag_examples(self, examples: List[QuoteTagExample], query_vector=None) -> List[QuoteTagExample]:
         related_tag_examples = self.few_shot_examples_from_tags([example.tag for example in examples])
 
         examples.extend(related_tag_examples)
         
-        return examples[:20]
+        return self.select_examples(examples, query_vector)
+    
+    def select_examples(self, examples: List[QuoteTagExample], query_vector=None) -> List[QuoteTagExample]:
+        """
+        Removes duplicate quotes from the candidate examples and keeps at most MAX_FEW_SHOT_EXAMPLES.
+
+        With example_token_budget, examples are picked by maximal marginal relevance: relevance to
+        the section (query_vector) against similarity to the examples already picked, using the
+        vectors stored in quote_vector_store, until the budget is used. Without vectors the
+        candidates are taken in retrieval order. Examples larger than the remaining budget are skipped.
+        """
+        # Ordered de-duplication on the quote text
+        unique = {}
+        for example in examples:
+            unique.setdefault(" ".join(example.quote.split()), example)
+        examples = list(unique.values())
+        
+        if self.example_token_budget is None:
+            return examples[:MAX_FEW_SHOT_EXAMPLES]
+        
+        costs = [estimate_tokens(self.format_example(example)) for example in examples]
+        vectors = self._example_vectors(examples) if query_vector is not None else None
+        if vectors is not None:
+            query = np.asarray(query_vector, dtype=np.float32)
+            relevance = vectors @ (query / (np.linalg.norm(query) or 1))
+            similarity = vectors @ vectors.T
+        else:
+            # Retrieval order as relevance, no diversity information
+            relevance = np.linspace(1, 0, len(examples))
+            similarity = None
+        
+        selected, remaining, used = [], list(range(len(examples))), 0
+        while remaining and len(selected) < MAX_FEW_SHOT_EXAMPLES:
+            redundancy = similarity[np.ix_(remaining, selected)].max(axis=1) if similarity is not None and selected else 0
+            scores = self.mmr_lambda * relevance[remaining] - (1 - self.mmr_lambda) * redundancy
+            best = remaining.pop(int(np.argmax(scores)))
+            if used + costs[best] <= self.example_token_budget:
+                selected.append(best)
+                used += costs[best]
+        
+        self.instrumentation.record('example_tokens', used)
+        return [examples[i] for i in selected]
+    
+    def _example_vectors(self, examples: List[QuoteTagExample]) -> Optional[np.ndarray]:
+        # Normalized vectors of the example quotes from quote_vector_store, None if unavailable
+        if self._store_embeddings(self.quote_vector_store) is None:
+            return None
+        if self._quote_rows is None:
+            store = self.quote_vector_store
+            self._quote_rows = {store.docstore.search(doc_id).page_content: row
+                                for row, doc_id in store.index_to_docstore_id.items()}
+        
+        rows = [self._quote_rows.get(example.quote) for example in examples]
+        if any(row is None for row in rows):
+            return None
+        vectors = np.vstack([self.quote_vector_store.index.reconstruct(int(row)) for row in rows])
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+    
+    def few_shot_examples_batch(self, quotes: List[str], vectors=None) -> List[List[QuoteTagExample]]:
+        """
+        Few-shot examples for many quotes at once: one embed_documents call for all quotes,
+        one matrix search on the quote index and the precomputed related tags.
+
+        Parameters:
+        - quotes (List[str]): Section answers, e.g. all sections of a transcript.
+        - vectors: Embeddings of the quotes when already computed (e.g. by the section gate).
+
+        Returns:
+        - List[List[QuoteTagExample]]: Examples of every quote, as returned by few_shot_examples.
+        """
+        embeddings = self._store_embeddings(self.quote_vector_store)
+        if embeddings is None:
+            return [self.few_shot_examples(quote) for quote in quotes]
+        
+        if vectors is None:
+            vectors = embeddings.embed_documents(quotes)
+        neighbours = self._vector_search(self.quote_vector_store, vectors, self.k)
+        
+        return [self._with_related_tag_examples([QuoteTagExample(quote = retrieved_quote,
+                                                                 tag = self.quote_tag_map.get(retrieved_quote))
+                                                 for retrieved_quote in retrieved_quotes],
+                                                vector)
+                for retrieved_quotes, vector in zip(neighbours, vectors)]
     
+    def section_examples(self, sections: List[TranscriptSection], vectors=None) -> List[Optional[List[QuoteTagExample]]]:
+        """
+        Retrieves the examples of all sections up front when batch_retrieval is enabled.
+        None entries are retrieved one by one when their section is tagged.
+        """
+        if not self.batch_retrieval or not sections:
+            return [None] * len(sections)
+        try:
+            with self.instrumentation.stage('retrieval'):
+                return self.few_shot_examples_batch([section.a for section in sections], vectors)
+        except Exception as e:
+            print(f"Batched retrieval failed, retrieving examples per section ({type(e).__name__}: {e})")
+            return [None] * len(sections)
     
-    def tag_section(self, section: TranscriptSection) -> pd.DataFrame:
+    def section_prompt(self, section: TranscriptSection, examples: Optional[List[QuoteTagExample]] = None) -> str:
+        """
+        Builds the prompt of a section, retrieving its few-shot examples unless they are given.
+        """
+        if examples is None:
+            with self.instrumentation.stage('retrieval'):
+                examples = self.few_shot_examples(section.a)
+        self.instrumentation.record('examples', len(examples))
+        
+        with self.instrumentation.stage('prompt'):
+            return self.construct_prompt(section.a, examples)
+
+    def postprocess(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Vectorized post-processing of tagged rows: drops rows below the confidence threshold
+        and adds the Tag Group of every tag.
+
+        Parameters:
+        - df (DataFrame): Rows with at least Quote, Tag and Confidence columns.
+
+        Returns:
+        - DataFrame: Same rows above the threshold, with the Tag Group column.
+        """
+        # Output columns in the order of output.csv, extra columns (e.g. Participant) last
+        columns = ['Quote', 'Tag', 'Confidence', 'Tag Group'] + [c for c in df.columns if c not in ('Quote', 'Tag', 'Confidence', 'Tag Group')]
+        if df.empty:
+            return pd.DataFrame(columns=columns)
+        
+        confidence = pd.to_numeric(df['Confidence'], errors='coerce')
+        keep = confidence >= self.threshold
+        df = df[keep].assign(Confidence=confidence[keep])
+        
+        return self.add_tag_group(df)[columns].reset_index(drop=True)
+    
+    
+    def tag_section(self, section: TranscriptSection, examples: Optional[List[QuoteTagExample]] = None) -> pd.DataFrame:
         """
         Tags sentences from a single interview response.
 
         Parameters:
         - section (TranscriptSection): A transcript section containing a question and answer.
+        - examples (List[QuoteTagExample]): Pre-retrieved few-shot examples, retrieved here when None.
 
         Returns:
         - DataFrame: DataFrame containing Quote, Tag, Confidence, and Tag Group columns.
         """
-        q, a = section.q, section.a
+        return self.postprocess(self.records_frame(self._tag_section(section, examples)))
+    
+    def _tag_section(self, section: TranscriptSection, examples: Optional[List[QuoteTagExample]] = None) -> List[dict]:
+        # Section records before post-processing
+        prompt = self.section_prompt(section, examples)
+        response = self.query_language_model(prompt)
+        return self.section_records(prompt, response)
+    
+    async def atag_section(self, section: TranscriptSection, examples: Optional[List[QuoteTagExample]] = None) -> pd.DataFrame:
+        """
+        Async version of tag_section, awaiting the language model with ainvoke.
+        """
+        return self.postprocess(self.records_frame(await self._atag_section(section, examples)))
+    
+    async def _atag_section(self, section: TranscriptSection, examples: Optional[List[QuoteTagExample]] = None) -> List[dict]:
+        # Retrieval is synchronous, keep it off the event loop
+        prompt = await asyncio.to_thread(self.section_prompt, section, examples)
+        response = await self.aquery_language_model(prompt)
+        return await self.asection_records(prompt, response)
+    
+    def batch_sections(self, sections: List[TranscriptSection]) -> List[List[TranscriptSection]]:
+        """
+        Packs consecutive sections into batches of at most batch_token_budget answer tokens.
+        A section larger than the budget gets a batch of its own.
+        """
+        batches, batch, batch_tokens = [], [], 0
+        for section in sections:
+            tokens = estimate_tokens(section.a)
+            if batch and batch_tokens + tokens > self.batch_token_budget:
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(section)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+    
+    def batch_prompt(self, batch: List[TranscriptSection], batch_examples: Optional[List[Optional[List[QuoteTagExample]]]] = None):
+        """
+        Builds the prompt of a batch, retrieving the few-shot examples of its sections unless they are given.
+        """
+        if batch_examples is None:
+            batch_examples = [None] * len(batch)
         
-        examples = self.few_shot_examples(a)
+        # Union of the examples of every section, without duplicates and capped like a single section
+        examples = {}
+        for section, section_examples in zip(batch, batch_examples):
+            if section_examples is None:
+                with self.instrumentation.stage('retrieval'):
+                    section_examples = self.few_shot_examples(section.a)
+            for example in section_examples:
+                examples.setdefault(example.quote, example)
+        examples = self.select_examples(list(examples.values()))
+        self.instrumentation.record('examples', len(examples))
         
-        # Construct prompt and query language model
-        prompt = self.construct_prompt(a, examples)
-        response = self.query_language_model(prompt)
+        with self.instrumentation.stage('prompt'):
+            return self.construct_batch_prompt([section.a for section in batch], examples)
+    
+    def split_batch_records(self, records: List[dict], batch_size: int) -> List[List[dict]]:
+        """
+        Splits the records of a batch response back into the records of every section, using their section id.
+        In a batch of one section, records without a section id belong to that section. Other records
+        without a valid section id are dropped and counted as invalid items of the response parser.
+        """
+        results = [[] for _ in range(batch_size)]
+        dropped = 0
+        for record in records:
+            section_id = record.pop('section', None)
+            if section_id is None and batch_size == 1:
+                section_id = 1
+            try:
+                section_id = int(section_id)
+            except (TypeError, ValueError):
+                dropped += 1
+                continue
+            if 1 <= section_id <= batch_size:
+                results[section_id - 1].append(record)
+            else:
+                dropped += 1
+        if dropped:
+            self.response_parser.count_invalid(dropped)
+            self.instrumentation.count('dropped_batch_records', dropped)
+        return results
+    
+    def tag_batch(self, batch: List[TranscriptSection], batch_examples=None) -> List[pd.DataFrame]:
+        """
+        Tags several consecutive sections with a single language model call.
 
-        # Process the response from the model to generate tags
-        df = self.process_llm_response(response)
+        Returns:
+        - List[DataFrame]: One DataFrame per section, with the same columns as tag_section.
+        """
+        return [self.postprocess(self.records_frame(records)) for records in self._tag_batch(batch, batch_examples)]
+    
+    def _tag_batch(self, batch: List[TranscriptSection], batch_examples=None) -> List[List[dict]]:
+        prompt = self.batch_prompt(batch, batch_examples)
+        response = self.query_language_model(prompt)
+        return self.split_batch_records(self.section_records(prompt, response), len(batch))
+    
+    async def atag_batch(self, batch: List[TranscriptSection], batch_examples=None) -> List[pd.DataFrame]:
+        """
+        Async version of tag_batch.
+        """
+        return [self.postprocess(self.records_frame(records)) for records in await self._atag_batch(batch, batch_examples)]
+    
+    async def _atag_batch(self, batch: List[TranscriptSection], batch_examples=None) -> List[List[dict]]:
+        prompt = await asyncio.to_thread(self.batch_prompt, batch, batch_examples)
+        response = await self.aquery_language_model(prompt)
+        return self.split_batch_records(await self.asection_records(prompt, response), len(batch))
+    
+    def _record_failure(self, section: TranscriptSection, error: Exception):
+        self.failed_sections.append((section, error))
+        self.instrumentation.count('failed_sections')
+        print(f"Failed to tag section ({type(error).__name__}: {error}): {section.a[:80]!r}")
+    
+    def run_stats(self) -> dict:
+        """
+        Cache, rate limiter and failure statistics of the tagger, e.g. as extra entries of a run report.
+        """
+        return {
+            'failed_sections': len(self.failed_sections),
+            'cache': self.cache.stats() if self.cache is not None else None,
+            'rate_limiter': self.rate_limiter.stats() if self.rate_limiter is not None else None,
+            'responses': self.response_parser.stats(),
+            'section_gate': self.section_gate.stats() if self.section_gate is not None else None,
+        }
+    
+    def _safe_tag_section(self, section: TranscriptSection, examples=None) -> Optional[List[dict]]:
+        try:
+            return self._tag_section(section, examples)
+        except Exception as e:
+            self._record_failure(section, e)
+            return None
+    
+    def _safe_tag_batch(self, batch: List[TranscriptSection], batch_examples=None) -> List[Optional[List[dict]]]:
+        try:
+            return self._tag_batch(batch, batch_examples)
+        except Exception as e:
+            for section in batch:
+                self._record_failure(section, e)
+            return [None] * len(batch)
+    
+    async def _asafe_tag_section(self, section: TranscriptSection, examples=None) -> Optional[List[dict]]:
+        try:
+            return await self._atag_section(section, examples)
+        except Exception as e:
+            self._record_failure(section, e)
+            return None
+    
+    async def _asafe_tag_batch(self, batch: List[TranscriptSection], batch_examples=None) -> List[Optional[List[dict]]]:
+        try:
+            return await self._atag_batch(batch, batch_examples)
+        except Exception as e:
+            for section in batch:
+                self._record_failure(section, e)
+            return [None] * len(batch)
+    
+    def _run(self, function, items: list) -> list:
+        # Every item is a tuple of arguments of function
+        if self.max_concurrency <= 1:
+            return [function(*item) for item in tqdm(items, desc="Tagging sections")]
+        
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            # executor.map yields results in input order
+            return list(tqdm(executor.map(lambda item: function(*item), items), total=len(items), desc="Tagging sections"))
+    
+    async def _arun(self, coroutine_function, items: list) -> list:
+        semaphore = asyncio.Semaphore(max(1, self.max_concurrency))
+        
+        async def run(item):
+            async with semaphore:
+                return await coroutine_function(*item)
+        
+        # gather keeps the results in input order
+        return await asyncio.gather(*(run(item) for item in items))
+    
+    def _work_items(self, sections: List[TranscriptSection], vectors=None) -> list:
+        # (section, examples) pairs, or (batch, batch_examples) pairs in batching mode
+        examples = self.section_examples(sections, vectors)
+        if not self.batch_token_budget:
+            return list(zip(sections, examples))
+        
+        items, start = [], 0
+        for batch in self.batch_sections(sections):
+            items.append((batch, examples[start:start + len(batch)]))
+            start += len(batch)
+        return items
+    
+    def _gate_sections(self, sections: List[TranscriptSection]) -> Tuple[List[int], List[int], Optional[list]]:
+        # Positions of the sections sent to the model and of the gated ones, with the vectors of the former
+        if self.section_gate is None or not sections:
+            return list(range(len(sections))), [], None
+        
+        with self.instrumentation.stage('gate'):
+            texts = [section.a for section in sections]
+            vectors = self.section_gate.embed(texts)
+            keep = self.section_gate.keep(texts, vectors)
+        passed = [i for i, kept in enumerate(keep) if kept]
+        gated = [i for i, kept in enumerate(keep) if not kept]
+        
+        # Lower bound of the prompt tokens saved: static prefix and section, without the examples
+        tokens_saved = sum(estimate_tokens(self.prompt_prefix) + estimate_tokens(sections[i].a) for i in gated)
+        self.section_gate.record(len(sections), len(gated), tokens_saved)
+        self.instrumentation.count('gated_sections', len(gated))
+        self.instrumentation.count('gated_prompt_tokens', tokens_saved)
+        return passed, gated, [vectors[i] for i in passed]
+    
+    @staticmethod
+    def _ungate(n_sections: int, passed: List[int], results: list, gated: List[int], gated_results: list) -> list:
+        # Results of the passed and gated sections back in the input order
+        all_results = [None] * n_sections
+        for positions, position_results in ((passed, results), (gated, gated_results)):
+            for i, records in zip(positions, position_results):
+                all_results[i] = records
+        return all_results
+    
+    def _chunk_sections(self, sections: List[TranscriptSection]) -> Tuple[List[TranscriptSection], List[int], List[int]]:
+        # Windows of the long sections, with the position of the section each one comes from
+        # and the offset of the window in the answer of that section
+        if not self.max_section_tokens:
+            return sections, list(range(len(sections))), [0] * len(sections)
+        
+        chunks, owners, offsets = [], [], []
+        for i, section in enumerate(sections):
+            windows = chunk_spans(section.a, self.max_section_tokens, self.chunk_overlap_tokens)
+            if len(windows) > 1:
+                self.instrumentation.count('chunked_sections')
+            chunks.extend(TranscriptSection(q=section.q, a=window) for _, window in windows)
+            owners.extend([i] * len(windows))
+            offsets.extend(start for start, _ in windows)
+        return chunks, owners, offsets
+    
+    def _merge_chunks(self, sections: List[TranscriptSection], owners: List[int], offsets: List[int],
+                      results: list) -> List[Optional[List[dict]]]:
+        # Records of the windows of every section merged back into maximal quotes
+        if len(owners) == len(sections):
+            return results
+        
+        section_results = [[] for _ in sections]
+        section_starts = [[] for _ in sections]
+        for owner, offset, records in zip(owners, offsets, results):
+            if records is None or section_results[owner] is None:
+                # A section fails if any of its windows failed
+                section_results[owner] = None
+            else:
+                section_results[owner].extend(records)
+                # Quotes of a window are looked up from where the window starts
+                section_starts[owner].extend([offset] * len(records))
+        
+        chunk_counts = Counter(owners)
+        return [merge_quotes(records, section.a, starts) if records is not None and chunk_counts[i] > 1 else records
+                for i, (section, records, starts) in enumerate(zip(sections, section_results, section_starts))]
+    
+    def tag_sections(self, sections: List[TranscriptSection]) -> List[Optional[List[dict]]]:
+        """
+        Tags a list of sections, using a thread pool when max_concurrency is above 1
+        and packing them into batches when batch_token_budget is set.
 
-        # Append Tag Group for each tag based on available tag definitions
-        df['Tag Group'] = df['tag'].apply(lambda x: next((tag.tag_group for tag in self.tags if tag.tag == x), ''))
+        Parameters:
+        - sections (List[TranscriptSection]): Sections to tag.
 
-        # Rename columns for clarity
-        df.rename(columns={'quote': 'Quote', 'tag': 'Tag', 'confidence': 'Confidence'}, inplace=True)
+        Returns:
+        - List[Optional[List[dict]]]: Quote, Tag and Confidence records of every section in the input order
+          (before postprocess), None for sections that failed.
+        """
+        self.instrumentation.count('sections', len(sections))
+        passed, gated, vectors = self._gate_sections(sections)
+        passed_sections = [sections[i] for i in passed]
         
-        return df
+        chunks, owners, offsets = self._chunk_sections(passed_sections)
+        # The gate vectors are those of the whole sections, not of their windows
+        items = self._work_items(chunks, vectors if len(chunks) == len(passed_sections) else None)
+        if self.batch_token_budget:
+            results = self._run(self._safe_tag_batch, items)
+            results = [records for batch_results in results for records in batch_results]
+        else:
+            results = self._run(self._safe_tag_section, items)
+        results = self._merge_chunks(passed_sections, owners, offsets, results)
         
+        gated_sections = [sections[i] for i in gated]
+        gated_results = (self.gated_tagger.tag_sections(gated_sections) if self.gated_tagger is not None and gated_sections
+                         else [[] for _ in gated_sections])
+        return self._ungate(len(sections), passed, results, gated, gated_results)
+    
+    async def atag_sections(self, sections: List[TranscriptSection]) -> List[Optional[List[dict]]]:
+        """
+        Async version of tag_sections, keeping at most max_concurrency requests in flight.
+        """
+        self.instrumentation.count('sections', len(sections))
+        # Gating and retrieval are synchronous, keep them off the event loop
+        passed, gated, vectors = await asyncio.to_thread(self._gate_sections, sections)
+        passed_sections = [sections[i] for i in passed]
+        
+        chunks, owners, offsets = self._chunk_sections(passed_sections)
+        items = await asyncio.to_thread(self._work_items, chunks, vectors if len(chunks) == len(passed_sections) else None)
+        if self.batch_token_budget:
+            results = await self._arun(self._asafe_tag_batch, items)
+            results = [records for batch_results in results for records in batch_results]
+        else:
+            results = await self._arun(self._asafe_tag_section, items)
+        results = self._merge_chunks(passed_sections, owners, offsets, results)
+        
+        gated_sections = [sections[i] for i in gated]
+        gated_results = (await self.gated_tagger.atag_sections(gated_sections) if self.gated_tagger is not None and gated_sections
+                         else [[] for _ in gated_sections])
+        return self._ungate(len(sections), passed, results, gated, gated_results)
+    
+    def _combine_section_results(self, results: List[Optional[List[dict]]]) -> pd.DataFrame:
+        # A single DataFrame built from the records of all sections
+        return self.records_frame([record for records in results if records for record in records])
+    
+    def _combine_transcript_results(self, transcripts: Dict[str, List[TranscriptSection]], results: List[Optional[List[dict]]]) -> pd.DataFrame:
+        all_records, participants = [], []
+        start = 0
+        for participant, transcript in transcripts.items():
+            for records in results[start:start + len(transcript)]:
+                if records:
+                    all_records.extend(records)
+                    participants.extend([participant] * len(records))
+            start += len(transcript)
+
+        final_df = self.records_frame(all_records)
+        final_df['Participant'] = pd.Series(participants, dtype=object)
+        
+        # Post-process all rows in a single pass
+        return self.postprocess(final_df)
 
     def tag_transcript(self, transcript: List[TranscriptSection]) -> pd.DataFrame:
         """
@@ -283,19 +1053,13 @@ class TranscriptTagger:
         Returns:
         - DataFrame: DataFrame containing Quote, Tag, Confidence, and Tag Group columns.
         """
-        all_results = []
-        for section in tqdm(transcript, desc="Tagging sections in transcript"):
-            df = self.tag_section(section)
-            if not df.empty:
-                all_results.append(df)
-
-        # Concatenate all results into a single DataFrame
-        final_df = pd.concat(all_results, ignore_index=True) if all_results else pd.DataFrame()
-        final_df = final_df if not final_df.empty else pd.DataFrame(columns=['Quote', 'Tag', 'Confidence', 'Tag Group'])
-        
-        final_df =  self.add_tag_group(final_df)
-        
-        return final_df
+        return self.postprocess(self._combine_section_results(self.tag_sections(transcript)))
+    
+    async def atag_transcript(self, transcript: List[TranscriptSection]) -> pd.DataFrame:
+        """
+        Async version of tag_transcript, e.g. `df = await tagger.atag_transcript(sections)` in a notebook.
+        """
+        return self.postprocess(self._combine_section_results(await self.atag_sections(transcript)))
 
     def tag_transcripts(self, transcripts: Dict[str, List[TranscriptSection]]) -> pd.DataFrame:
         """
@@ -307,25 +1071,75 @@ class TranscriptTagger:
         Returns:
         - DataFrame: Pandas DataFrame containing Quote, Participant, Tag Group, and Tag columns.
         """
-        all_results = []
-        for participant, transcript in tqdm(transcripts.items(), desc="Tagging transcripts for each participant"):
-            df = self.tag_transcript(transcript)
-            if not df.empty:
-                df['Participant'] = participant
-                all_results.append(df)
+        # Tag the sections of all transcripts together so the workers never idle between participants
+        sections = [section for transcript in transcripts.values() for section in transcript]
+        return self._combine_transcript_results(transcripts, self.tag_sections(sections))
+    
+    async def atag_transcripts(self, transcripts: Dict[str, List[TranscriptSection]]) -> pd.DataFrame:
+        """
+        Async version of tag_transcripts, e.g. `df = await tagger.atag_transcripts(transcripts)` in a notebook.
+        """
+        sections = [section for transcript in transcripts.values() for section in transcript]
+        return self._combine_transcript_results(transcripts, await self.atag_sections(sections))
 
-        # Concatenate all results into a single DataFrame
-        final_df = pd.concat(all_results, ignore_index=True) if all_results else pd.DataFrame()
-        final_df = final_df if not final_df.empty else pd.DataFrame(columns=['Quote', 'Tag', 'Confidence', 'Tag Group', 'Participant'])
-        final_df =  self.add_tag_group(final_df)
-        
-        return final_df
+    def stream_tag_transcripts(self, transcripts: Union[Dict[str, List[TranscriptSection]], Iterable[Tuple[str, List[TranscriptSection]]]],
+                               output_path: Optional[str] = None, checkpoint_path: Optional[str] = None,
+                               chunk_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        """
+        Tags transcripts as a stream, yielding the tags of every section as soon as they are available.
 
-    def add_tag_group(self, df):
-        # Create a dictionary to map tag to tag_group for quick lookup
-        tag_to_group = {tag.tag.lower(): tag.tag_group for tag in self.tags}
+        Only chunk_size sections are held in memory at a time. The rows of every section are
+        appended to output_path before the section is recorded in the checkpoint, along with the
+        size of output_path at that point, so a restarted job with the same checkpoint_path skips
+        the sections already written and first drops any rows written after the last recorded
+        section (e.g. by a crash between the two writes) instead of duplicating them.
+        Failed sections are not recorded and are tagged again on restart.
+
+        Parameters:
+        - transcripts: Dictionary of Participant name to sections, or an iterable of (participant, sections) pairs.
+        - output_path (str): Optional CSV file the rows are appended to (same columns as tag_transcripts).
+        - checkpoint_path (str): Optional manifest of completed (participant, section index) pairs.
+        - chunk_size (int): Number of sections tagged together, defaults to 4 per concurrent worker.
 
-        # Use apply to fill in the Tag Group based on the tag_to_group dictionary
-        df['Tag Group'] = df['Tag'].apply(lambda x: tag_to_group.get(x.lower(), 'No Tag Group'))
+        Yields:
+        - DataFrame: Quote, Tag, Confidence, Tag Group and Participant columns of one section (possibly empty).
+        """
+        checkpoint = TaggingCheckpoint(checkpoint_path) if checkpoint_path else None
+        chunk_size = chunk_size or 4 * max(1, self.max_concurrency)
+        items = transcripts.items() if isinstance(transcripts, dict) else transcripts
+        
+        if checkpoint is not None and output_path:
+            output_size = os.path.getsize(output_path) if os.path.exists(output_path) else 0
+            if checkpoint.output_size is None:
+                checkpoint.mark_output_size(output_size)
+            elif output_size > checkpoint.output_size:
+                # Rows of a section that was not recorded, it is tagged again below
+                print(f"Dropping {output_size - checkpoint.output_size} bytes of {output_path} written after the last checkpoint")
+                with open(output_path, 'r+b') as f:
+                    f.truncate(checkpoint.output_size)
+        
+        for participant, transcript in items:
+            pending = [(i, section) for i, section in enumerate(transcript)
+                       if checkpoint is None or not checkpoint.is_done(participant, i)]
+            
+            for start in range(0, len(pending), chunk_size):
+                chunk = pending[start:start + chunk_size]
+                results = self.tag_sections([section for _, section in chunk])
+                
+                for (section_index, _), records in zip(chunk, results):
+                    if records is None:
+                        continue
+                    df = self.postprocess(self.records_frame(records).assign(Participant=participant))
+                    if output_path and not df.empty:
+                        header = not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+                        df.to_csv(output_path, mode='a', header=header, index=False)
+                    if checkpoint is not None:
+                        checkpoint.mark_done(participant, section_index,
+                                             os.path.getsize(output_path) if output_path and os.path.exists(output_path) else None)
+                    yield df
+    
+    def add_tag_group(self, df):
+        # Vectorized lookup in the case-normalised tag index built in __init__
+        df['Tag Group'] = df['Tag'].astype(str).str.lower().map(self.tag_groups).fillna('No Tag Group')
         
         return df